@@ -0,0 +1,279 @@
+"""
+ShopSmart AI - Batch generation jobs
+
+A batch job is a list of UserInputs that is worked off in the background.
+Inputs with the same cache key are generated once per job. Jobs, inputs and
+finished results are checkpointed to SQLite, so a restart picks up the
+pending work again. Workers share a global concurrency and rate limit and
+back off when the LLM scheduler sheds them.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from scheduler import SchedulerRejected
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batch_jobs (
+    id TEXT PRIMARY KEY, created REAL NOT NULL, finished REAL, total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_tasks (
+    job_id TEXT NOT NULL, key TEXT NOT NULL, input TEXT NOT NULL, status TEXT NOT NULL,
+    result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (job_id, key)
+);
+CREATE TABLE IF NOT EXISTS batch_entries (
+    job_id TEXT NOT NULL, position INTEGER NOT NULL, key TEXT NOT NULL, PRIMARY KEY (job_id, position)
+);
+"""
+
+
+class BatchStore:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def create(self, job_id: str, keys: List[str], inputs: List[dict]):
+        tasks = {}
+        for key, value in zip(keys, inputs):
+            tasks.setdefault(key, value)
+        with self._lock:
+            self._db.execute("INSERT INTO batch_jobs (id, created, total) VALUES (?, ?, ?)", (job_id, time.time(), len(keys)))
+            self._db.executemany(
+                "INSERT INTO batch_tasks (job_id, key, input, status) VALUES (?, ?, ?, 'pending')",
+                [(job_id, key, json.dumps(value, ensure_ascii=False)) for key, value in tasks.items()],
+            )
+            self._db.executemany(
+                "INSERT INTO batch_entries (job_id, position, key) VALUES (?, ?, ?)",
+                [(job_id, i, key) for i, key in enumerate(keys)],
+            )
+            self._db.commit()
+
+    def pending(self) -> List[tuple]:
+        """(job_id, key, input) of every unfinished task, oldest job first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT t.job_id, t.key, t.input FROM batch_tasks t JOIN batch_jobs j ON j.id = t.job_id "
+                "WHERE t.status = 'pending' ORDER BY j.created, t.rowid"
+            ).fetchall()
+        return [(job_id, key, json.loads(value)) for job_id, key, value in rows]
+
+    def finish(self, job_id: str, key: str, result: Optional[dict], error: Optional[str], attempts: int) -> bool:
+        """Store a task outcome; returns True when it was the job's last pending task."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE batch_tasks SET status = ?, result = ?, error = ?, attempts = ? WHERE job_id = ? AND key = ?",
+                ("failed" if error else "done", json.dumps(result, ensure_ascii=False) if result is not None else None, error, attempts, job_id, key),
+            )
+            left = self._db.execute("SELECT COUNT(*) FROM batch_tasks WHERE job_id = ? AND status = 'pending'", (job_id,)).fetchone()[0]
+            if not left:
+                self._db.execute("UPDATE batch_jobs SET finished = ? WHERE id = ?", (time.time(), job_id))
+            self._db.commit()
+        return not left
+
+    def job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT created, finished, total FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM batch_tasks WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+        created, finished, total = row
+        return {
+            "job_id": job_id,
+            "status": "done" if finished else "running",
+            "total": total,
+            "unique": sum(counts.values()),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "pending": counts.get("pending", 0),
+            "created_at": created,
+            "finished_at": finished,
+        }
+
+    def results(self, job_id: str, offset: int, limit: int) -> List[dict]:
+        """Entries in submission order; duplicates share the result of their task."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT e.position, t.status, t.result, t.error FROM batch_entries e "
+                "JOIN batch_tasks t ON t.job_id = e.job_id AND t.key = e.key "
+                "WHERE e.job_id = ? AND e.position >= ? ORDER BY e.position LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        return [
+            {"index": position, "status": status, "result": json.loads(result) if result else None, "error": error}
+            for position, status, result, error in rows
+        ]
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs that completed before the given timestamp."""
+        with self._lock:
+            ids = [r[0] for r in self._db.execute("SELECT id FROM batch_jobs WHERE finished < ?", (older_than,)).fetchall()]
+            for table, column in (("batch_entries", "job_id"), ("batch_tasks", "job_id"), ("batch_jobs", "id")):
+                self._db.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(i,) for i in ids])
+            self._db.commit()
+        return len(ids)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class BatchQueue:
+    def __init__(self, run: Callable[[dict], Awaitable[dict]], db_path: str, concurrency: int = 2,
+                 rate_limit: float = 0.0, max_attempts: int = 3, retention: float = 7 * 86400):
+        self._run = run
+        self.store = BatchStore(db_path)
+        self.concurrency = max(1, concurrency)
+        self.rate_limit = rate_limit
+        self.max_attempts = max(1, max_attempts)
+        self.retention = retention
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._progress: dict = {}
+        self._next_start = 0.0
+        self._pace_lock = asyncio.Lock()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def start(self):
+        purged = await asyncio.to_thread(self.store.purge, time.time() - self.retention)
+        pending = await asyncio.to_thread(self.store.pending)
+        for task in pending:
+            self._queue.put_nowait(task)
+        if pending or purged:
+            logger.info(f"Batch queue: resumed {len(pending)} pending tasks, purged {purged} old jobs")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self.store.close()
+
+    async def submit(self, keys: List[str], inputs: List[dict]) -> dict:
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, job_id, keys, inputs)
+        queued = set()
+        for key, value in zip(keys, inputs):
+            if key not in queued:
+                queued.add(key)
+                self._queue.put_nowait((job_id, key, value))
+        logger.info(f"Batch {job_id}: {len(keys)} inputs, {len(queued)} unique")
+        return await self.job(job_id)
+
+    async def job(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.job, job_id)
+
+    async def results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[dict]:
+        return await asyncio.to_thread(self.store.results, job_id, offset, limit)
+
+    async def iter_results(self, job_id: str, follow: bool = True, page: int = 200) -> AsyncIterator[dict]:
+        """Yield entries in order; with follow, wait for unfinished ones instead of yielding them."""
+        offset = 0
+        while True:
+            progress = self._event(job_id)
+            entries = await self.results(job_id, offset, page)
+            if not entries:
+                return
+            for entry in entries:
+                if follow and entry["status"] == "pending":
+                    break
+                yield entry
+                offset = entry["index"] + 1
+            else:
+                continue
+            try:
+                # Timeout so a job left over from another process is still polled
+                await asyncio.wait_for(progress.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+
+    def _event(self, job_id: str) -> asyncio.Event:
+        event = self._progress.get(job_id)
+        if event is None:
+            event = self._progress[job_id] = asyncio.Event()
+        return event
+
+    def _notify(self, job_id: str):
+        event = self._progress.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _pace(self):
+        """Space task starts at least 1/rate_limit seconds apart."""
+        if self.rate_limit <= 0:
+            return
+        async with self._pace_lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + 1 / self.rate_limit
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _worker(self):
+        while True:
+            job_id, key, value = await self._queue.get()
+            try:
+                await self._process(job_id, key, value)
+            except Exception as e:
+                logger.error(f"Batch {job_id}: task {key[:12]} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job_id: str, key: str, value: dict):
+        attempts = 0
+        while True:
+            await self._pace()
+            attempts += 1
+            self.running += 1
+            try:
+                result = await self._run(value)
+                error = None
+                break
+            except SchedulerRejected as e:
+                # Shed by the scheduler: interactive traffic has the slots, not a failure of this input
+                attempts -= 1
+                self.retried += 1
+                delay = e.retry_after
+            except Exception as e:
+                result, error = None, f"{type(e).__name__}: {e}"
+                if attempts >= self.max_attempts:
+                    break
+                self.retried += 1
+                delay = 2 ** attempts
+            finally:
+                self.running -= 1
+            await asyncio.sleep(delay)
+
+        if error:
+            self.failed += 1
+            logger.warning(f"Batch {job_id}: task {key[:12]} failed after {attempts} attempts: {error}")
+        else:
+            self.completed += 1
+        finished = await asyncio.to_thread(self.store.finish, job_id, key, result, error, attempts)
+        self._notify(job_id)
+        if finished:
+            logger.info(f"Batch {job_id} finished")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.concurrency,
+            "rate_limit": self.rate_limit,
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
@@ -0,0 +1,210 @@
+"""
+ShopSmart AI - Response cache
+
+Two tiers: an in-memory LRU with TTL and an optional SQLite file that
+survives restarts. Concurrent requests for the same key share a single
+upstream call.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+
+def canonical_input(user_input, budget_bucket: float = 1.0) -> dict:
+    """Reduce a UserInput to the fields that change the generated result."""
+    stores = sorted({s.strip().casefold() for s in user_input.supermarkets if s.strip()})
+    tokens = re.split(r"[,;\n]+", (user_input.preferences or "").casefold())
+    preferences = sorted({" ".join(t.split()) for t in tokens if t.strip()})
+    bucket = budget_bucket if budget_bucket > 0 else 1.0
+    return {
+        "supermarkets": stores,
+        "budget": round(user_input.budget / bucket) * bucket,
+        "preferences": preferences,
+        "family_size": user_input.family_size,
+        "language": user_input.language.strip().casefold(),
+        "mode": user_input.mode,
+        "days": (user_input.days or 7) if user_input.mode == "menu" else None,
+        "engine": user_input.engine,
+    }
+
+
+def cache_key(user_input, budget_bucket: float = 1.0) -> str:
+    raw = json.dumps(canonical_input(user_input, budget_bucket), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class SQLiteTier:
+    def __init__(self, path: str, table: str = "responses"):
+        self._lock = threading.Lock()
+        self._table = table
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(f"SELECT value, expires FROM {self._table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._db.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict, ttl: float):
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, budget_bucket: float = 1.0, db_path: Optional[str] = None, table: str = "responses"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.budget_bucket = budget_bucket
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: dict = {}
+        self._disk = SQLiteTier(db_path, table) if db_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    def key(self, user_input) -> str:
+        return cache_key(user_input, self.budget_bucket)
+
+    def _get_memory(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: dict):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = self._get_memory(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self._disk is not None:
+            value = await asyncio.to_thread(self._disk.get, key)
+            if value is not None:
+                self.disk_hits += 1
+                self._set_memory(key, value)
+                return value
+        return None
+
+    async def set(self, key: str, value: dict):
+        self._set_memory(key, value)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, self.ttl)
+
+    @contextlib.contextmanager
+    def computing(self, key: str):
+        """Register the caller as the one computing key.
+
+        Others asking for key wait for the yielded future, which the caller
+        resolves with set_result. If the caller fails the waiters get the
+        error; if it is cancelled or gives up, they compute the value themselves.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            yield future
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+                # Mark retrieved so a failure nobody else waited on is not logged
+                future.exception()
+            raise
+        finally:
+            future.cancel()
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def wait(self, key: str) -> Optional[dict]:
+        """Wait for the computation of key in flight, if any.
+
+        Returns None when nothing is in flight, so the caller computes the value
+        itself. When the one computing is cancelled, the first waiter takes over.
+        """
+        while key in self._inflight:
+            pending = self._inflight[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only the leader was cancelled, not us: look again
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        return None
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[dict]], bypass: bool = False) -> dict:
+        """Return the cached value for key, computing it at most once at a time."""
+        if bypass:
+            self.bypassed += 1
+        else:
+            value = await self.get(key)
+            if value is not None:
+                return value
+
+        value = await self.wait(key)
+        if value is not None:
+            return value
+
+        self.misses += 1
+        with self.computing(key) as future:
+            value = await compute()
+            await self.set(key, value)
+            future.set_result(value)
+            return value
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "persistent": self._disk is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
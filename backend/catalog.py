@@ -0,0 +1,282 @@
+"""
+ShopSmart AI - Local product catalog and budget optimizer
+
+The catalog (catalog.csv) lists pack sizes, prices and nutrition per store.
+It is loaded into flat arrays, one per column, and used in two ways:
+optimize() builds a complete shopping list without calling the model, and
+Catalog.snap() replaces the model's guessed prices with catalog prices.
+"""
+
+import csv
+import math
+import re
+from array import array
+from collections import defaultdict
+from typing import List, Optional
+
+from planner import format_quantity, parse_quantity
+
+UNITS = ["g", "ml", "pcs"]
+TAGS = ["vegan", "vegetarian", "gluten_free", "lactose_free", "pork", "non_food"]
+TAG_BITS = {tag: 1 << i for i, tag in enumerate(TAGS)}
+
+# Category order of the generated list: (share of the budget, distinct products)
+CATEGORY_PLAN = {
+    "vegetables": (0.16, 4),
+    "fruits": (0.11, 3),
+    "meat": (0.15, 2),
+    "fish": (0.07, 1),
+    "dairy": (0.14, 4),
+    "bread": (0.07, 2),
+    "beverages": (0.06, 2),
+    "snacks": (0.04, 1),
+    "frozen": (0.05, 1),
+    "pantry": (0.10, 4),
+    "cleaning": (0.03, 1),
+    "hygiene": (0.02, 1),
+}
+
+# Preference keywords (en/de/uk) -> tag every food item must have, or "!tag" it must not have
+DIET_KEYWORDS = [
+    (("vegan", "веган"), "vegan"),
+    (("vegetar", "вегетаріан"), "vegetarian"),
+    (("gluten", "glutenfrei", "zöliakie", "celiac", "глютен"), "gluten_free"),
+    (("lactose", "laktose", "dairy-free", "milchfrei", "лактоз"), "lactose_free"),
+    (("halal", "pork", "schwein", "свинин"), "!pork"),
+]
+
+PACK_WORDS = ("pack", "packung", "packs", "упаков", "пачк")
+QUANTITY_WORDS = re.compile(r"\d+|\d*(g|kg|ml|l|pc|pcs|x)")
+# Words that leave the product unchanged (already normalized)
+PLAIN_WORDS = {"organic", "fresh", "bio", "frisch", "frische", "свіжий", "свіжі", "органічний", "органічні"}
+
+
+def normalize(name: str) -> tuple:
+    """Casefolded word tuple with simple plural endings removed."""
+    words = []
+    for word in re.sub(r"[^\w]+", " ", name.casefold()).split():
+        if len(word) > 3 and word.endswith("oes"):
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return tuple(words)
+
+
+def diet_masks(preferences: str) -> tuple:
+    """Return (required, excluded) tag bit masks for the given preferences."""
+    text = (preferences or "").casefold()
+    required = excluded = 0
+    for keywords, tag in DIET_KEYWORDS:
+        if any(k in text for k in keywords):
+            if tag.startswith("!"):
+                excluded |= TAG_BITS[tag[1:]]
+            else:
+                required |= TAG_BITS[tag]
+    return required, excluded
+
+
+class Catalog:
+    def __init__(self):
+        self.stores: List[str] = []
+        self.names: List[tuple] = []  # (en, de, uk)
+        self.store = array("H")
+        self.category = array("B")
+        self.unit = array("B")
+        self.size = array("d")
+        self.price = array("d")
+        self.calories = array("d")
+        self.protein = array("d")
+        self.fat = array("d")
+        self.carbs = array("d")
+        self.tags = array("H")
+        self._product = array("H")  # index into names, shared by the same product in every store
+        self._by_name = {}  # normalized name or alias -> product index
+        self._rows = {}  # (product index, store index) -> row
+
+    @classmethod
+    def load(cls, path: str) -> "Catalog":
+        catalog = cls()
+        categories = list(CATEGORY_PLAN)
+        products = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                if row["store"] not in catalog.stores:
+                    catalog.stores.append(row["store"])
+                product = products.setdefault(row["product"], len(products))
+                if product == len(catalog.names):
+                    catalog.names.append((row["product"], row["product_de"], row["product_uk"]))
+                    for name in [row["product"], row["product_de"], row["product_uk"], *row["aliases"].split(";")]:
+                        if name:
+                            catalog._by_name.setdefault(normalize(name), product)
+
+                catalog._rows[(product, catalog.stores.index(row["store"]))] = len(catalog.price)
+                catalog._product.append(product)
+                catalog.store.append(catalog.stores.index(row["store"]))
+                catalog.category.append(categories.index(row["category"]))
+                catalog.unit.append(UNITS.index(row["unit"]))
+                catalog.size.append(float(row["size"]))
+                catalog.price.append(float(row["price"]))
+                catalog.calories.append(float(row["calories"]))
+                catalog.protein.append(float(row["protein"]))
+                catalog.fat.append(float(row["fat"]))
+                catalog.carbs.append(float(row["carbs"]))
+                catalog.tags.append(sum(TAG_BITS[t] for t in row["tags"].split(";") if t))
+        return catalog
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    def store_indexes(self, supermarkets: List[str]) -> set:
+        wanted = {s.strip().casefold() for s in supermarkets}
+        return {i for i, store in enumerate(self.stores) if store.casefold() in wanted}
+
+    def match(self, product: str, store: str) -> Optional[int]:
+        """Row for a free-text product name at a store, or None.
+
+        Only exact names and aliases match, after dropping sizes such as
+        "500 g" and words like "organic" that do not change the product.
+        "Soy milk" or "Sweet potatoes" name other products than Milk or
+        Potatoes, so they are left alone.
+        """
+        store_index = next((i for i, s in enumerate(self.stores) if s.casefold() == store.strip().casefold()), None)
+        if store_index is None:
+            return None
+        words = normalize(product)
+        found = self._by_name.get(words)
+        if found is None:
+            found = self._by_name.get(tuple(w for w in words if not QUANTITY_WORDS.fullmatch(w) and w not in PLAIN_WORDS))
+        return None if found is None else self._rows.get((found, store_index))
+
+    def packs(self, row: int, quantity: str) -> Optional[int]:
+        """Number of catalog packs in a quantity like "1.5 kg" or "12 pcs", None if the units differ."""
+        parsed = parse_quantity(quantity)
+        if parsed is None:
+            return None
+        amount, unit, label = parsed
+        if unit == "count" and any(word in label.casefold() for word in PACK_WORDS):
+            return max(1, math.ceil(amount))
+        catalog_unit = UNITS[self.unit[row]]
+        if unit != ("count" if catalog_unit == "pcs" else catalog_unit):
+            return None
+        # Allow 5% slack so "1 kg" of a 1000 g pack is one pack, not two
+        return max(1, math.ceil(amount / self.size[row] - 0.05))
+
+    def snap(self, items: List[dict]) -> int:
+        """Set approx_price of matching items to catalog prices; returns how many were changed."""
+        snapped = 0
+        for item in items:
+            row = self.match(str(item.get("product", "")), str(item.get("store", "")))
+            if row is None:
+                continue
+            packs = self.packs(row, str(item.get("quantity", "")))
+            if packs is None:
+                continue
+            item["approx_price"] = round(packs * self.price[row], 2)
+            snapped += 1
+        return snapped
+
+    def item(self, row: int, packs: int, language: str) -> dict:
+        names = self.names[self._product[row]]
+        unit = UNITS[self.unit[row]]
+        return {
+            "product": names[{"de": 1, "uk": 2}.get(language, 0)],
+            "quantity": format_quantity(packs * self.size[row], "count" if unit == "pcs" else unit, "pcs"),
+            "store": self.stores[self.store[row]],
+            "approx_price": round(packs * self.price[row], 2),
+            "category": list(CATEGORY_PLAN)[self.category[row]],
+            "calories": int(packs * self.calories[row]),
+            "protein": round(packs * self.protein[row], 1),
+            "fat": round(packs * self.fat[row], 1),
+            "carbs": round(packs * self.carbs[row], 1),
+        }
+
+
+def optimize(catalog: Catalog, supermarkets: List[str], budget: float, family_size: int = 2,
+             preferences: str = "", language: str = "en", low: float = 0.85, high: float = 0.98) -> Optional[List[dict]]:
+    """Build a shopping list from the catalog that spends low..high of the budget.
+
+    Returns None when none of the requested stores is in the catalog.
+    """
+    stores = catalog.store_indexes(supermarkets)
+    if not stores:
+        return None
+    required, excluded = diet_masks(preferences)
+    non_food = TAG_BITS["non_food"]
+
+    # Cheapest allowed row per product across the requested stores
+    cheapest = {}
+    for row in range(len(catalog)):
+        tags = catalog.tags[row]
+        if catalog.store[row] not in stores or tags & excluded:
+            continue
+        if not tags & non_food and tags & required != required:
+            continue
+        product = catalog._product[row]
+        if product not in cheapest or catalog.price[row] < catalog.price[cheapest[product]]:
+            cheapest[product] = row
+    rows = sorted(cheapest.values())
+
+    # Nutrition per euro, with a floor so water and non-food still rank by price
+    price = [catalog.price[r] for r in rows]
+    value = [catalog.calories[r] / 4000 + catalog.protein[r] / 25 + 0.5 for r in rows]
+    score = dict(zip(rows, (v / p for v, p in zip(value, price))))
+
+    categories = list(CATEGORY_PLAN)
+    by_category = defaultdict(list)
+    for row in sorted(rows, key=lambda r: (-score[r], r)):
+        by_category[categories[catalog.category[row]]].append(row)
+
+    base = max(1, round(family_size / 2))
+    max_packs = max(2, family_size * 2)
+    pantry = categories.index("pantry")
+
+    def limit(row: int) -> int:
+        # A household needs one bottle of dish soap, and staples like flour keep for weeks
+        if catalog.tags[row] & non_food:
+            return 1
+        return base if catalog.category[row] == pantry else max_packs
+
+    packs = {}
+    for category, (_, slots) in CATEGORY_PLAN.items():
+        for row in by_category[category][:slots]:
+            packs[row] = min(base, limit(row))
+
+    def cost() -> float:
+        return sum(catalog.price[r] * n for r, n in packs.items())
+
+    total = cost()
+    # Over budget: first buy fewer packs of the priciest line, then drop the lowest-scoring products
+    while packs and total > high * budget:
+        multi = [r for r, n in packs.items() if n > 1]
+        if multi:
+            packs[max(multi, key=lambda r: (catalog.price[r], r))] -= 1
+        else:
+            del packs[min(packs, key=lambda r: (score[r], -r))]
+        total = cost()
+
+    spent = defaultdict(float)
+    for row, n in packs.items():
+        spent[categories[catalog.category[row]]] += catalog.price[row] * n
+
+    # Top up towards the middle of the target range, feeding the category furthest below its share
+    target = (low + high) / 2 * budget
+    while total < target:
+        room = high * budget - total
+        options = [r for r, n in packs.items() if n < limit(r) and catalog.price[r] <= room]
+        if not options:
+            options = [r for r in rows if r not in packs and catalog.price[r] <= room]
+        if not options:
+            break
+
+        def priority(r):
+            category = categories[catalog.category[r]]
+            return (CATEGORY_PLAN[category][0] * budget - spent[category], score[r], -r)
+
+        row = max(options, key=priority)
+        packs[row] = packs.get(row, 0) + 1
+        spent[categories[catalog.category[row]]] += catalog.price[row]
+        total += catalog.price[row]
+
+    ordered = sorted(packs, key=lambda r: (catalog.category[r], -score[r], r))
+    return [catalog.item(row, packs[row], language) for row in ordered]
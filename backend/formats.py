@@ -0,0 +1,99 @@
+"""
+ShopSmart AI - Model output formats
+
+"json" asks the model for the AIResponse shape directly. "compact" asks for
+positional rows instead, with stores and categories given as indexes, which
+saves repeating every key for each of the 15-25+ items. expand() turns
+either form into the AIResponse shape.
+"""
+
+from typing import List
+
+CATEGORIES = ["vegetables", "fruits", "meat", "fish", "dairy", "bread", "beverages", "snacks", "frozen", "pantry", "cleaning", "hygiene"]
+
+ITEM_FIELDS = ["product", "quantity", "store", "approx_price", "category", "calories", "protein", "fat", "carbs"]
+MEAL_FIELDS = ["name", "description", "calories"]
+MEALS = ["breakfast", "lunch", "dinner", "snack"]
+
+JSON_ITEM = '{"product":"Name","quantity":"Amount","store":"Store","approx_price":0.00,"category":"cat","calories":100,"protein":5.0,"fat":2.0,"carbs":15.0}'
+JSON_DAY = '{"day":"Day name","breakfast":{"name":"Meal","description":"Short description","calories":300},"lunch":{"name":"Meal","description":"Description","calories":500},"dinner":{"name":"Meal","description":"Description","calories":600},"snack":{"name":"Snack","description":"Description","calories":150}}'
+
+COMPACT_ITEM_HELP = f"""Each item is a row: [{", ".join(ITEM_FIELDS)}]
+store = 0-based index in the Supermarkets list, category = 0-based index in [{", ".join(CATEGORIES)}]"""
+COMPACT_DAY_HELP = """Each day is a row: [day, breakfast, lunch, dinner, snack], each meal is [name, description, calories]"""
+
+
+def shopping_schema(output_format: str) -> str:
+    if output_format == "compact":
+        return f"""{COMPACT_ITEM_HELP}
+
+JSON only:
+{{"items":[["Name","Amount",0,0.00,4,100,5.0,2.0,15.0]],"total_cost":0.00,"notes":"Brief notes"}}"""
+    return f"""JSON only:
+{{"items":[{JSON_ITEM}],"total_cost":0.00,"notes":"Brief notes"}}"""
+
+
+def menu_schema(output_format: str) -> str:
+    if output_format == "compact":
+        return f"""{COMPACT_DAY_HELP}
+{COMPACT_ITEM_HELP}
+
+JSON only:
+{{"menu":[["Day name",["Meal","Short description",300],["Meal","Description",500],["Meal","Description",600],["Snack","Description",150]]],"items":[["Name","Amount",0,0.00,4,100,5.0,2.0,15.0]],"total_cost":0.00,"notes":"Brief notes"}}"""
+    return f"""JSON only:
+{{"menu":[{JSON_DAY}],"items":[{JSON_ITEM}],"total_cost":0.00,"notes":"Brief notes"}}"""
+
+
+def revision_schema(output_format: str) -> str:
+    if output_format == "compact":
+        return f"""{COMPACT_DAY_HELP}
+{COMPACT_ITEM_HELP}
+
+JSON only, with only the changes:
+{{"remove":[3,7],"replace":[{{"index":0,"item":["Name","Amount",0,0.00,4,100,5.0,2.0,15.0]}}],"add":[["Name","Amount",0,0.00,4,100,5.0,2.0,15.0]],"menu":[{{"index":0,"day":["Day name",["Meal","Short description",300],["Meal","Description",500],["Meal","Description",600],["Snack","Description",150]]}}],"notes":"Brief notes"}}"""
+    return f"""JSON only, with only the changes:
+{{"remove":[3,7],"replace":[{{"index":0,"item":{JSON_ITEM}}}],"add":[{JSON_ITEM}],"menu":[{{"index":0,"day":{JSON_DAY}}}],"notes":"Brief notes"}}"""
+
+
+def _lookup(value, options: List[str], default: str) -> str:
+    if isinstance(value, bool):
+        return default
+    if isinstance(value, (int, float)) and value == int(value) and 0 <= int(value) < len(options):
+        return options[int(value)]
+    return str(value) if isinstance(value, str) and value else default
+
+
+def expand_item(row, supermarkets: List[str]):
+    """Turn an item row into an item dict; dicts are passed through unchanged."""
+    if not isinstance(row, list):
+        return row
+    item = dict(zip(ITEM_FIELDS, row))
+    item["store"] = _lookup(item.get("store"), supermarkets, supermarkets[0] if supermarkets else "")
+    item["category"] = _lookup(item.get("category"), CATEGORIES, "other")
+    item["quantity"] = str(item.get("quantity", ""))
+    return item
+
+
+def _expand_meal(meal):
+    if not isinstance(meal, list):
+        return meal
+    return dict(zip(MEAL_FIELDS, meal))
+
+
+def expand_day(row):
+    if not isinstance(row, list) or not row:
+        return row
+    day = {"day": str(row[0])}
+    for name, meal in zip(MEALS, row[1:]):
+        if meal is not None:
+            day[name] = _expand_meal(meal)
+    return day
+
+
+def expand(data: dict, supermarkets: List[str]) -> dict:
+    """Normalize a parsed model answer in either format to the AIResponse shape."""
+    if isinstance(data.get("items"), list):
+        data["items"] = [expand_item(row, supermarkets) for row in data["items"]]
+    if isinstance(data.get("menu"), list):
+        data["menu"] = [expand_day(row) for row in data["menu"]]
+    return data
@@ -5,26 +5,121 @@ Supervisor: Kharchenko A.O.
 NTU "KhPI" - 2025
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
 from typing import List, Optional
+import asyncio
+import httpx
 import openai
 import os
 import json
 import logging
+import time
+import uuid
 from datetime import datetime
 from dotenv import load_dotenv
+from scheduler import LLMScheduler, SchedulerRejected
+from cache import ResponseCache
+from parsing import ArrayScanner, OutputParseError, extract_document, salvage
+from planner import merge_chunks, merge_items, number, split_days, sum_nutrition
+from formats import expand, expand_day, expand_item, menu_schema, revision_schema, shopping_schema
+from revisions import apply_delta, describe_changes, format_items, format_menu
+from catalog import Catalog, optimize
+from batch import BatchQueue
+from metrics import LAG_BUCKETS, Counter, Gauge, Histogram, LoopLagMonitor, render, timed
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="ShopSmart AI API", version="1.0.0")
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=False, allow_methods=["*"], allow_headers=["*"])
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+# One pooled HTTP connection set shared by every completion on this worker
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+    limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+)
+# OPENAI_BASE_URL points the client at another endpoint, e.g. bench/fake_openai.py
+client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None, http_client=http_client)
+
+stage_seconds = Histogram("shopsmart_stage_seconds", "Time spent in each stage of a generation", ("stage",))
+request_seconds = Histogram("shopsmart_request_seconds", "End-to-end generation time per endpoint and mode", ("endpoint", "mode"))
+llm_tokens = Counter("shopsmart_llm_tokens_total", "Tokens reported by the OpenAI API", ("type",))
+errors_total = Counter("shopsmart_errors_total", "Failed requests by exception type", ("type",))
+loop_lag = Histogram("shopsmart_event_loop_lag_seconds", "How late the event loop woke up from a 100 ms sleep", buckets=LAG_BUCKETS)
+loop_lag_last = Gauge("shopsmart_event_loop_lag_last_seconds", "Most recent event loop lag sample")
+runtime_stats = Gauge("shopsmart_runtime", "Numeric counters from /stats", ("section", "name"))
+loop_monitor = LoopLagMonitor(loop_lag, loop_lag_last)
+
+scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "20")),
+)
+
+# Wire format requested from the model: "json" (AIResponse shape) or "compact" (positional rows)
+OUTPUT_FORMAT = os.getenv("LLM_OUTPUT_FORMAT", "json")
+
+# Cut-off shopping lists shorter than this get a continuation request; cut-off menus always do
+MIN_ITEMS = int(os.getenv("MIN_ITEMS", "15"))
+CONTINUATION_MAX_TOKENS = int(os.getenv("CONTINUATION_MAX_TOKENS", "1500"))
+
+catalog = Catalog.load(os.getenv("CATALOG_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.csv"))
+# Replace model-estimated prices with catalog prices where the product is known
+CATALOG_SNAP = os.getenv("CATALOG_SNAP", "1") == "1"
 
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+REVISION_MAX_TOKENS = int(os.getenv("REVISION_MAX_TOKENS", "1500"))
+
+# Menu plans longer than this many days are generated in parallel day ranges
+MENU_CHUNK_DAYS = int(os.getenv("MENU_CHUNK_DAYS", "4"))
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "512")),
+    ttl=float(os.getenv("CACHE_TTL", "3600")),
+    budget_bucket=float(os.getenv("CACHE_BUDGET_BUCKET", "1.0")),
+    db_path=os.getenv("CACHE_DB_PATH") or None,
+)
+
+# Past results by generation_id, so they can be revised later
+generation_store = ResponseCache(
+    max_entries=int(os.getenv("GENERATION_STORE_MAX_ENTRIES", "2048")),
+    ttl=float(os.getenv("GENERATION_STORE_TTL", "86400")),
+    db_path=os.getenv("CACHE_DB_PATH") or None,
+    table="generations",
+)
+
+async def run_batch_input(data: dict) -> dict:
+    return (await cached_generation(UserInput(**data))).model_dump()
+
+# Background jobs for /generate/batch, checkpointed so a restart resumes them
+BATCH_MAX_INPUTS = int(os.getenv("BATCH_MAX_INPUTS", "5000"))
+batch_queue = BatchQueue(
+    run_batch_input,
+    db_path=os.getenv("BATCH_DB_PATH", "batch.sqlite3"),
+    concurrency=int(os.getenv("BATCH_CONCURRENCY", "2")),
+    rate_limit=float(os.getenv("BATCH_RATE_LIMIT", "0")),
+    max_attempts=int(os.getenv("BATCH_MAX_ATTEMPTS", "3")),
+    retention=float(os.getenv("BATCH_RETENTION", str(7 * 86400))),
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    await batch_queue.start()
+    yield
+    await batch_queue.stop()
+    await loop_monitor.stop()
+    await client.close()
+    response_cache.close()
+    generation_store.close()
+
+app = FastAPI(title="ShopSmart AI API", version="1.0.0", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=False, allow_methods=["*"], allow_headers=["*"])
 
 class UserInput(BaseModel):
     supermarkets: List[str]
@@ -33,7 +128,9 @@ class UserInput(BaseModel):
     family_size: int = Field(ge=1, le=20, default=2)
     language: str = "en"
     mode: str = "shopping"
-    days: Optional[int] = 7
+    days: Optional[int] = Field(default=7, ge=1, le=14)
+    fresh: bool = False
+    engine: str = "llm"
 
 class Meal(BaseModel):
     name: str
@@ -58,12 +155,37 @@ class ShoppingItem(BaseModel):
     fat: Optional[float] = 0
     carbs: Optional[float] = 0
 
+class Nutrition(BaseModel):
+    calories: int = 0
+    protein: float = 0
+    fat: float = 0
+    carbs: float = 0
+
+class ModelOutput(BaseModel):
+    items: List[ShoppingItem] = []
+    total_cost: Optional[float] = 0
+    notes: Optional[str] = ""
+    menu: Optional[List[DayMenu]] = None
+
 class AIResponse(BaseModel):
     items: List[ShoppingItem]
     total_cost: float
     notes: str
     generated_at: str
     menu: Optional[List[DayMenu]] = None
+    total_nutrition: Optional[Nutrition] = None
+    generation_id: Optional[str] = None
+
+class BatchInput(BaseModel):
+    inputs: List[UserInput] = Field(min_length=1, max_length=BATCH_MAX_INPUTS)
+
+class RevisionInput(BaseModel):
+    supermarkets: Optional[List[str]] = None
+    budget: Optional[float] = Field(default=None, gt=0, le=10000)
+    preferences: Optional[str] = None
+    family_size: Optional[int] = Field(default=None, ge=1, le=20)
+    language: Optional[str] = None
+    days: Optional[int] = Field(default=None, ge=1, le=14)
 
 LANG = {
     "en": ("Respond in English.", "Shopping list optimized for your budget."),
@@ -87,12 +209,12 @@ Categories: vegetables, fruits, meat, fish, dairy, bread, beverages, snacks, fro
 
 For FOOD items, estimate nutrition. Non-food = 0.
 
-JSON only:
-{{"items":[{{"product":"Name","quantity":"Amount","store":"Store","approx_price":0.00,"category":"cat","calories":100,"protein":5.0,"fat":2.0,"carbs":15.0}}],"total_cost":0.00,"notes":"Brief notes"}}"""
+{shopping_schema(OUTPUT_FORMAT)}"""
 
-def get_menu_prompt(lang: str, days: int) -> str:
+def get_menu_prompt(lang: str, days: int, start: int = 0) -> str:
     instruction = LANG.get(lang, LANG["en"])[0]
-    day_names = DAY_NAMES.get(lang, DAY_NAMES["en"])[:days]
+    names = DAY_NAMES.get(lang, DAY_NAMES["en"])
+    day_names = [names[(start + i) % len(names)] for i in range(days)]
     
     return f"""You are ShopSmart AI meal planner. {instruction}
 
@@ -103,8 +225,19 @@ Days: {', '.join(day_names)}
 
 Consider: balanced nutrition, variety, budget optimization.
 
-JSON only:
-{{"menu":[{{"day":"Day name","breakfast":{{"name":"Meal","description":"Short description","calories":300}},"lunch":{{"name":"Meal","description":"Description","calories":500}},"dinner":{{"name":"Meal","description":"Description","calories":600}},"snack":{{"name":"Snack","description":"Description","calories":150}}}}],"items":[{{"product":"Name","quantity":"Amount","store":"Store","approx_price":0.00,"category":"cat","calories":100,"protein":5.0,"fat":2.0,"carbs":15.0}}],"total_cost":0.00,"notes":"Brief notes"}}"""
+{menu_schema(OUTPUT_FORMAT)}"""
+
+def get_revision_prompt(lang: str, menu: bool) -> str:
+    instruction = LANG.get(lang, LANG["en"])[0]
+    what = "shopping list and meal plan" if menu else "shopping list"
+    return f"""You are ShopSmart AI for German supermarkets. {instruction}
+
+The user changed their request. Update their existing {what} with as few changes as possible.
+Use 85-98% of the new budget. Refer to existing items by their number.
+Stores: Lidl/Aldi=budget, Edeka=premium, Rewe=mid-range, Kaufland=bulk.
+"menu" holds only days that must be redone or added, each with the day's number from the current menu or the days to add. Leave out empty keys.
+
+{revision_schema(OUTPUT_FORMAT)}"""
 
 @app.get("/")
 async def root():
@@ -114,51 +247,573 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
-@app.post("/generate", response_model=AIResponse)
-async def generate(user_input: UserInput):
-    try:
-        logger.info(f"Mode: {user_input.mode}, Budget: €{user_input.budget}, Family: {user_input.family_size}")
-        
-        if user_input.mode == "menu":
-            system_prompt = get_menu_prompt(user_input.language, user_input.days or 7)
-            user_msg = f"Supermarkets: {', '.join(user_input.supermarkets)}\nBudget: €{user_input.budget}\nFamily: {user_input.family_size}\nPreferences: {user_input.preferences or 'None'}\n\nCreate {user_input.days}-day meal plan with shopping list."
-        else:
-            system_prompt = get_shopping_prompt(user_input.language)
-            user_msg = f"Supermarkets: {', '.join(user_input.supermarkets)}\nBudget: €{user_input.budget}\nFamily: {user_input.family_size}\nPreferences: {user_input.preferences or 'None'}\n\nGenerate 15-25 items."
-        
-        response = client.chat.completions.create(
+catalog_stats = {"optimized": 0, "snapped": 0}
+output_stats = {"parsed": 0, "salvaged": 0, "truncated": 0, "dropped_elements": 0, "continuations": 0, "continuation_failures": 0}
+
+@app.get("/stats")
+async def stats():
+    return {
+        "scheduler": scheduler.stats(),
+        "cache": response_cache.stats(),
+        "output": output_stats,
+        "catalog": {"products": len(catalog), **catalog_stats},
+        "batch": batch_queue.stats()
+    }
+
+@timed(stage_seconds, stage="prompt_build")
+def build_messages(user_input: UserInput) -> list:
+    if user_input.mode == "menu":
+        system_prompt = get_menu_prompt(user_input.language, user_input.days or 7)
+        user_msg = f"Supermarkets: {', '.join(user_input.supermarkets)}\nBudget: €{user_input.budget}\nFamily: {user_input.family_size}\nPreferences: {user_input.preferences or 'None'}\n\nCreate {user_input.days}-day meal plan with shopping list."
+    else:
+        system_prompt = get_shopping_prompt(user_input.language)
+        user_msg = f"Supermarkets: {', '.join(user_input.supermarkets)}\nBudget: €{user_input.budget}\nFamily: {user_input.family_size}\nPreferences: {user_input.preferences or 'None'}\n\nGenerate 15-25 items."
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_msg}]
+
+@timed(stage_seconds, stage="prompt_build")
+def build_menu_chunk_messages(user_input: UserInput, start: int, count: int) -> list:
+    days = user_input.days or 7
+    budget = round(user_input.budget * count / days, 2)
+    system_prompt = get_menu_prompt(user_input.language, count, start)
+    user_msg = f"Supermarkets: {', '.join(user_input.supermarkets)}\nBudget: €{budget}\nFamily: {user_input.family_size}\nPreferences: {user_input.preferences or 'None'}\n\nThis is days {start + 1}-{start + count} of a {days}-day plan. Create the {count}-day meal plan with a shopping list for these days only."
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_msg}]
+
+def record_usage(usage):
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        # Streamed chunks carry usage as a plain dict
+        value = usage.get(f"{kind}_tokens") if isinstance(usage, dict) else getattr(usage, f"{kind}_tokens", None)
+        if value:
+            llm_tokens.inc(value, type=kind)
+
+async def complete(messages: list, max_tokens: int = 4000) -> str:
+    queued = time.perf_counter()
+    async with scheduler.slot():
+        stage_seconds.observe(time.perf_counter() - queued, stage="queue_wait")
+        with timed(stage_seconds, stage="upstream_total"):
+            response = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens
+            )
+    record_usage(response.usage)
+    return response.choices[0].message.content
+
+async def complete_stream(messages: list, max_tokens: int = 4000):
+    queued = time.perf_counter()
+    async with scheduler.slot():
+        started = time.perf_counter()
+        stage_seconds.observe(started - queued, stage="queue_wait")
+        stream = await client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_msg}],
+            messages=messages,
             temperature=0.7,
-            max_tokens=4000
+            max_tokens=max_tokens,
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}}
         )
-        
-        content = response.choices[0].message.content
-        if "```json" in content: content = content.split("```json")[1].split("```")[0]
-        elif "```" in content: content = content.split("```")[1].split("```")[0]
-        
-        data = json.loads(content.strip())
-        
-        if not data.get("notes"):
-            data["notes"] = LANG.get(user_input.language, LANG["en"])[1]
-        
-        return AIResponse(
-            items=data.get("items", []),
-            total_cost=data.get("total_cost", 0),
-            notes=data.get("notes", ""),
-            generated_at=datetime.now().isoformat(),
-            menu=data.get("menu")
-        )
-        
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON error: {e}")
-        raise HTTPException(status_code=500, detail="Failed to parse AI response")
-    except openai.APIError as e:
+        first = True
+        async for chunk in stream:
+            record_usage(getattr(chunk, "usage", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first:
+                    stage_seconds.observe(time.perf_counter() - started, stage="upstream_ttft")
+                    first = False
+                yield chunk.choices[0].delta.content
+        stage_seconds.observe(time.perf_counter() - started, stage="upstream_total")
+
+def validate_element(key: str, value, supermarkets: List[str]) -> Optional[dict]:
+    """Validate one item or day element; returns None for malformed ones."""
+    try:
+        if key == "items":
+            return ShoppingItem.model_validate(expand_item(value, supermarkets)).model_dump()
+        return DayMenu.model_validate(expand_day(value)).model_dump()
+    except ValueError as e:
+        logger.warning(f"Skipping invalid {key} element: {e}")
+        return None
+
+def decode_output(content: str, supermarkets: List[str]) -> tuple:
+    """Parse model output into the AIResponse shape.
+
+    Returns (data, complete). Well-formed output is validated in one pass
+    from the raw text; anything else is salvaged element by element, and
+    complete is False when the document was cut off.
+    """
+    try:
+        if OUTPUT_FORMAT == "compact":
+            # Finding and decoding the document are one parse step
+            with timed(stage_seconds, stage="parse"):
+                parsed = expand(json.loads(extract_document(content)), supermarkets)
+            with timed(stage_seconds, stage="validate"):
+                output = ModelOutput.model_validate(parsed)
+        else:
+            with timed(stage_seconds, stage="parse"):
+                document = extract_document(content)
+            # Pydantic decodes and validates the JSON text in one pass
+            with timed(stage_seconds, stage="validate"):
+                output = ModelOutput.model_validate_json(document)
+        output_stats["parsed"] += 1
+        return output.model_dump(), True
+    except ValueError as e:
+        logger.warning(f"Salvaging AI response: {str(e).splitlines()[0]}")
+
+    with timed(stage_seconds, stage="parse"):
+        raw, closed = salvage(content)
+    with timed(stage_seconds, stage="validate"):
+        data = {
+            "items": [x for x in (validate_element("items", v, supermarkets) for v in raw["items"]) if x],
+            "menu": [x for x in (validate_element("menu", v, supermarkets) for v in raw["menu"]) if x] or None,
+            "total_cost": raw.get("total_cost", 0),
+            "notes": raw.get("notes", ""),
+        }
+    if not data["items"] and not data["menu"]:
+        raise OutputParseError("No complete items in AI response")
+
+    output_stats["salvaged"] += 1
+    output_stats["dropped_elements"] += len(raw["items"]) - len(data["items"]) + len(raw["menu"]) - len(data["menu"] or [])
+    if not closed:
+        output_stats["truncated"] += 1
+    return data, closed
+
+async def continue_items(user_input: UserInput, data: dict, budget: float) -> dict:
+    """Ask only for the shopping items still missing from a cut-off answer."""
+    listed = ", ".join(item["product"] for item in data["items"]) or "None"
+    spent = sum(number(item.get("approx_price")) for item in data["items"])
+    if data.get("menu"):
+        meals = "; ".join(f"{day['day']}: " + ", ".join(day[m]["name"] for m in ("breakfast", "lunch", "dinner", "snack") if day.get(m)) for day in data["menu"])
+        task = f"Meals planned: {meals}\n\nAdd the products still needed for these meals."
+    else:
+        task = f"Generate {max(MIN_ITEMS - len(data['items']), 5)} more items."
+    user_msg = f"Supermarkets: {', '.join(user_input.supermarkets)}\nBudget left: €{max(budget - spent, 0):.2f}\nFamily: {user_input.family_size}\nPreferences: {user_input.preferences or 'None'}\nAlready on the list: {listed}\n\n{task} Do not repeat listed products."
+    messages = [{"role": "system", "content": get_shopping_prompt(user_input.language)}, {"role": "user", "content": user_msg}]
+    extra, _ = decode_output(await complete(messages, CONTINUATION_MAX_TOKENS), user_input.supermarkets)
+    return extra
+
+def needs_continuation(user_input: UserInput, data: dict) -> bool:
+    """Cut-off menus are always completed; cut-off shopping lists only when shorter than MIN_ITEMS."""
+    return user_input.mode == "menu" or len(data["items"]) < MIN_ITEMS
+
+async def continue_generation(user_input: UserInput, data: dict, start: int = 0, count: Optional[int] = None,
+                              merge: bool = True) -> dict:
+    """Fill in whatever a cut-off answer is missing instead of regenerating it.
+
+    With merge=False the new items are appended as separate lines, so the
+    lines already sent to a streaming client stay as they were.
+    """
+    output_stats["continuations"] += 1
+    try:
+        if user_input.mode == "menu":
+            days = user_input.days or 7
+            count = count or days
+            done = len(data.get("menu") or [])
+            if done < count:
+                logger.info(f"Continuing menu: days {start + done + 1}-{start + count}")
+                requests = [generate_menu_chunk(user_input, start + done, count - done, allow_continuation=False)]
+                if done and not data["items"]:
+                    # Cut off before the shopping list: the days we kept still need their products
+                    requests.append(continue_items(user_input, data, user_input.budget * done / days))
+                rest, *extra = await asyncio.gather(*requests)
+                if extra:
+                    data = {**data, "items": extra[0]["items"]}
+                return merge_chunks([data, rest], merge)
+            budget = user_input.budget * count / days
+        else:
+            budget = user_input.budget
+        logger.info(f"Continuing item list after {len(data['items'])} items")
+        extra = await continue_items(user_input, data, budget)
+        items = merge_items([data["items"], extra["items"]]) if merge else data["items"] + extra["items"]
+        return {**data, "items": items, "total_cost": list_total(items)}
+    except (OutputParseError, openai.APIError, SchedulerRejected) as e:
+        # A partial answer is still better than none, also when the continuation is shed under load
+        output_stats["continuation_failures"] += 1
+        logger.warning(f"Continuation failed: {e}")
+        data["total_cost"] = list_total(data["items"])
+        return data
+
+async def generate_menu_chunk(user_input: UserInput, start: int, count: int, allow_continuation: bool = True) -> dict:
+    content = await complete(build_menu_chunk_messages(user_input, start, count))
+    data, complete_ = decode_output(content, user_input.supermarkets)
+    if not complete_ and allow_continuation:
+        data = await continue_generation(user_input, data, start, count)
+    return data
+
+async def plan_menu(user_input: UserInput) -> dict:
+    chunks = split_days(user_input.days or 7, MENU_CHUNK_DAYS)
+    logger.info(f"Menu fan-out: {len(chunks)} chunks of up to {MENU_CHUNK_DAYS} days")
+    try:
+        # One admission for all chunks; the first failure cancels the rest
+        with scheduler.reserve(len(chunks)):
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(generate_menu_chunk(user_input, start, count)) for start, count in chunks]
+    except ExceptionGroup as e:
+        raise e.exceptions[0]
+    return merge_chunks([task.result() for task in tasks])
+
+async def menu_chunks_in_order(user_input: UserInput):
+    """Generate the day ranges in parallel and yield each one, in day order, once it is done."""
+    chunks = split_days(user_input.days or 7, MENU_CHUNK_DAYS)
+    logger.info(f"Streamed menu fan-out: {len(chunks)} chunks of up to {MENU_CHUNK_DAYS} days")
+    with scheduler.reserve(len(chunks)):
+        tasks = [asyncio.create_task(generate_menu_chunk(user_input, start, count)) for start, count in chunks]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            # The first failure or a closed stream cancels the ranges still running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+def list_total(items: List[dict]) -> float:
+    return round(sum(number(item.get("approx_price")) for item in items), 2)
+
+def reprice(items: List[dict]) -> float:
+    """Snap prices to the catalog where possible and return the list total."""
+    if CATALOG_SNAP:
+        catalog_stats["snapped"] += catalog.snap(items)
+    return list_total(items)
+
+def optimize_from_catalog(user_input: UserInput) -> Optional[dict]:
+    items = optimize(catalog, user_input.supermarkets, user_input.budget, user_input.family_size, user_input.preferences, user_input.language)
+    if items is None:
+        logger.info(f"No catalog stores in {user_input.supermarkets}, using AI")
+        return None
+    catalog_stats["optimized"] += 1
+    return {"items": items, "notes": ""}
+
+def catalog_only(user_input: UserInput) -> bool:
+    """Requests the catalog answers without a model call."""
+    return user_input.engine == "catalog" and user_input.mode != "menu"
+
+async def run_generation(user_input: UserInput) -> AIResponse:
+    logger.info(f"Mode: {user_input.mode}, Budget: €{user_input.budget}, Family: {user_input.family_size}")
+
+    data = optimize_from_catalog(user_input) if catalog_only(user_input) else None
+    if data is None:
+        if user_input.mode == "menu" and (user_input.days or 7) > MENU_CHUNK_DAYS:
+            data = await plan_menu(user_input)
+        else:
+            data, complete_ = decode_output(await complete(build_messages(user_input)), user_input.supermarkets)
+            if not complete_ and needs_continuation(user_input, data):
+                data = await continue_generation(user_input, data)
+        reprice(data.get("items", []))
+
+    if not data.get("notes"):
+        data["notes"] = LANG.get(user_input.language, LANG["en"])[1]
+
+    items = data.get("items", [])
+    response = AIResponse(
+        items=items,
+        total_cost=list_total(items),
+        notes=data.get("notes", ""),
+        generated_at=datetime.now().isoformat(),
+        menu=data.get("menu"),
+        total_nutrition=sum_nutrition(items),
+        generation_id=uuid.uuid4().hex
+    )
+    await remember_generation(user_input, response)
+    return response
+
+async def remember_generation(user_input: UserInput, response: AIResponse):
+    await generation_store.set(response.generation_id, {
+        "input": user_input.model_dump(exclude={"fresh"}),
+        "response": response.model_dump()
+    })
+
+async def cached_generation(user_input: UserInput) -> AIResponse:
+    async def compute() -> dict:
+        return (await run_generation(user_input)).model_dump()
+
+    key = response_cache.key(user_input)
+    data = await response_cache.get_or_compute(key, compute, bypass=user_input.fresh)
+    return AIResponse(**data)
+
+def http_error(e: Exception) -> HTTPException:
+    errors_total.inc(type=type(e).__name__)
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, SchedulerRejected):
+        logger.warning(f"Shed request: {e.reason} (in flight: {scheduler.in_flight}, queued: {scheduler.queued})")
+        return HTTPException(status_code=e.status_code, detail="Server busy, please retry later", headers={"Retry-After": str(e.retry_after)})
+    if isinstance(e, OutputParseError):
+        logger.error(f"Parse error: {e}")
+        return HTTPException(status_code=500, detail="Failed to parse AI response")
+    if isinstance(e, openai.APIError):
         logger.error(f"OpenAI error: {e}")
-        raise HTTPException(status_code=503, detail="AI service unavailable")
+        return HTTPException(status_code=503, detail="AI service unavailable")
+    logger.error(f"Error: {e}")
+    return HTTPException(status_code=500, detail=str(e))
+
+def json_response(result: AIResponse) -> Response:
+    with timed(stage_seconds, stage="serialize"):
+        return Response(content=result.model_dump_json(), media_type="application/json")
+
+@app.post("/generate", response_model=AIResponse)
+async def generate(user_input: UserInput):
+    try:
+        with timed(request_seconds, endpoint="generate", mode=user_input.mode):
+            return json_response(await cached_generation(user_input))
     except Exception as e:
-        logger.error(f"Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
+
+@timed(stage_seconds, stage="prompt_build")
+def build_revision_messages(user_input: UserInput, previous: dict, changes: List[str], new_days: List[tuple]) -> list:
+    system_prompt = get_revision_prompt(user_input.language, user_input.mode == "menu")
+    user_msg = f"Supermarkets: {', '.join(user_input.supermarkets)}\nBudget: €{user_input.budget}\nFamily: {user_input.family_size}\nPreferences: {user_input.preferences or 'None'}\n\nChanges: {'; '.join(changes)}\n\nCurrent list (€{previous['total_cost']}):\n{format_items(previous['items'])}"
+    if previous.get("menu"):
+        user_msg += f"\n\nCurrent menu:\n{format_menu(previous['menu'])}"
+    if new_days:
+        user_msg += f"\n\nAdd these days to the menu: {', '.join(f'{i}. {name}' for i, name in new_days)}"
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_msg}]
+
+def decode_delta(content: str, supermarkets: List[str]) -> dict:
+    try:
+        delta = json.loads(extract_document(content))
+    except ValueError:
+        raise OutputParseError("AI revision is not valid JSON")
+    if not isinstance(delta, dict):
+        raise OutputParseError("AI revision is not a JSON object")
+    delta["add"] = [x for x in (validate_element("items", v, supermarkets) for v in delta.get("add") or []) if x]
+    menu = []
+    for change in delta.get("menu") or []:
+        if isinstance(change, dict):
+            day = validate_element("menu", change.get("day"), supermarkets)
+            if day:
+                menu.append({"index": change.get("index"), "day": day})
+    delta["menu"] = menu
+    replace = []
+    for change in delta.get("replace") or []:
+        if isinstance(change, dict):
+            item = validate_element("items", change.get("item"), supermarkets)
+            if item:
+                replace.append({"index": change.get("index"), "item": item})
+    delta["replace"] = replace
+    return delta
+
+async def run_revision(previous: dict, old_input: UserInput, new_input: UserInput) -> AIResponse:
+    if new_input.language != old_input.language:
+        # A delta cannot translate the existing list, so start over
+        return await cached_generation(new_input)
+
+    changes = describe_changes(old_input.model_dump(), new_input.model_dump())
+    if not changes:
+        return AIResponse(**previous)
+    logger.info(f"Revising {previous['generation_id']}: {'; '.join(changes)}")
+
+    # The catalog re-plans the whole list in milliseconds, so a delta from the model would only be slower
+    data = optimize_from_catalog(new_input) if new_input.engine == "catalog" and new_input.mode != "menu" else None
+    if data is not None:
+        items, menu = data["items"], None
+        notes = LANG.get(new_input.language, LANG["en"])[1]
+    else:
+        previous = dict(previous)
+        new_days, days = [], None
+        if new_input.mode == "menu" and previous.get("menu") is not None:
+            days = new_input.days or 7
+            names = DAY_NAMES.get(new_input.language, DAY_NAMES["en"])
+            previous["menu"] = previous["menu"][:days]
+            new_days = [(i, names[i % len(names)]) for i in range(len(previous["menu"]), days)]
+
+        content = await complete(build_revision_messages(new_input, previous, changes, new_days), REVISION_MAX_TOKENS)
+        delta = decode_delta(content, new_input.supermarkets)
+        items, menu = apply_delta(previous["items"], previous.get("menu"), delta, days)
+        reprice(items)
+        notes = delta.get("notes") or previous["notes"]
+
+    response = AIResponse(
+        items=items,
+        total_cost=list_total(items),
+        notes=notes,
+        generated_at=datetime.now().isoformat(),
+        menu=menu,
+        total_nutrition=sum_nutrition(items),
+        generation_id=uuid.uuid4().hex
+    )
+    await remember_generation(new_input, response)
+    await response_cache.set(response_cache.key(new_input), response.model_dump())
+    return response
+
+@app.post("/generate/{generation_id}/revise", response_model=AIResponse)
+async def revise(generation_id: str, changes: RevisionInput):
+    stored = await generation_store.get(generation_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Generation not found or expired")
+    try:
+        old_input = UserInput(**stored["input"])
+        new_input = old_input.model_copy(update=changes.model_dump(exclude_none=True))
+        with timed(request_seconds, endpoint="revise", mode=new_input.mode):
+            return json_response(await run_revision(stored["response"], old_input, new_input))
+    except Exception as e:
+        raise http_error(e)
+
+@timed(stage_seconds, stage="serialize_event")
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_generation(user_input: UserInput, key: str, cached: Optional[dict] = None):
+    try:
+        if cached is None and catalog_only(user_input):
+            # The catalog answers in milliseconds, there is nothing to stream
+            cached = (await cached_generation(user_input)).model_dump()
+        elif cached is None:
+            # An identical request is already being generated: replay its result
+            cached = await response_cache.wait(key)
+        if cached is not None:
+            for item in cached["items"]:
+                yield sse("item", item)
+            for day in cached.get("menu") or []:
+                yield sse("day", day)
+            yield sse("summary", {k: cached.get(k) for k in ("total_cost", "notes", "generated_at", "generation_id")})
+            return
+
+        logger.info(f"Stream mode: {user_input.mode}, Budget: €{user_input.budget}, Family: {user_input.family_size}")
+        with response_cache.computing(key) as future:
+            if user_input.mode == "menu" and (user_input.days or 7) > MENU_CHUNK_DAYS:
+                chunks = []
+                async for chunk in menu_chunks_in_order(user_input):
+                    # Lines are sent per range and not merged, so the client and the stored result agree
+                    reprice(chunk["items"])
+                    for item in chunk["items"]:
+                        yield sse("item", item)
+                    for day in chunk.get("menu") or []:
+                        yield sse("day", day)
+                    chunks.append(chunk)
+                data = merge_chunks(chunks, merge=False)
+            else:
+                scanner = ArrayScanner()
+                items, menu = [], []
+                parse_time = validate_time = 0.0
+                async for delta in complete_stream(build_messages(user_input)):
+                    started = time.perf_counter()
+                    found = scanner.feed(delta)
+                    parse_time += time.perf_counter() - started
+                    for element_key, value in found:
+                        started = time.perf_counter()
+                        element = validate_element(element_key, value, user_input.supermarkets)
+                        validate_time += time.perf_counter() - started
+                        if element is None:
+                            continue
+                        if element_key == "items":
+                            reprice([element])
+                            items.append(element)
+                            yield sse("item", element)
+                        else:
+                            menu.append(element)
+                            yield sse("day", element)
+                stage_seconds.observe(parse_time, stage="parse")
+                stage_seconds.observe(validate_time, stage="validate")
+
+                if not items and not menu:
+                    raise OutputParseError("No complete items in AI response")
+                data, _ = salvage(scanner.buffer, keys=())
+                data.update(items=items, menu=menu or None)
+                if not scanner.done:
+                    output_stats["truncated"] += 1
+                if not scanner.done and needs_continuation(user_input, data):
+                    data = await continue_generation(user_input, data, merge=False)
+                    # Elements appended by the continuation have not been sent yet; nothing sent is changed
+                    reprice(data["items"][len(items):])
+                    for item in data["items"][len(items):]:
+                        yield sse("item", item)
+                    for day in (data.get("menu") or [])[len(menu):]:
+                        yield sse("day", day)
+
+            result = AIResponse(
+                items=data["items"],
+                total_cost=list_total(data["items"]),
+                notes=data.get("notes") or LANG.get(user_input.language, LANG["en"])[1],
+                generated_at=datetime.now().isoformat(),
+                menu=data.get("menu"),
+                total_nutrition=sum_nutrition(data["items"]),
+                generation_id=uuid.uuid4().hex
+            )
+            await remember_generation(user_input, result)
+            await response_cache.set(key, result.model_dump())
+            future.set_result(result.model_dump())
+        yield sse("summary", {"total_cost": result.total_cost, "notes": result.notes, "generated_at": result.generated_at, "generation_id": result.generation_id})
+    except SchedulerRejected as e:
+        errors_total.inc(type=type(e).__name__)
+        yield sse("error", {"status": e.status_code, "detail": "Server busy, please retry later", "retry_after": e.retry_after})
+    except OutputParseError as e:
+        errors_total.inc(type=type(e).__name__)
+        logger.error(f"Parse error: {e}")
+        yield sse("error", {"status": 500, "detail": "Failed to parse AI response"})
+    except openai.APIError as e:
+        errors_total.inc(type=type(e).__name__)
+        logger.error(f"OpenAI error: {e}")
+        yield sse("error", {"status": 503, "detail": "AI service unavailable"})
+
+@app.post("/generate/stream")
+async def generate_stream(user_input: UserInput):
+    key = response_cache.key(user_input)
+    cached = None if user_input.fresh else await response_cache.get(key)
+    if cached is None and not catalog_only(user_input) and not response_cache.in_flight(key):
+        # Only streams that will call the model are shed, and before the 200 is sent
+        try:
+            scheduler.admit()
+        except SchedulerRejected as e:
+            raise http_error(e)
+
+    async def events():
+        with timed(request_seconds, endpoint="stream", mode=user_input.mode):
+            async for event in stream_generation(user_input, key, cached):
+                yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/generate/batch", status_code=202)
+async def generate_batch(batch: BatchInput):
+    keys = [response_cache.key(user_input) for user_input in batch.inputs]
+    return await batch_queue.submit(keys, [user_input.model_dump() for user_input in batch.inputs])
+
+async def get_batch_job(job_id: str) -> dict:
+    job = await batch_queue.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found or expired")
+    return job
+
+@app.get("/generate/batch/{job_id}")
+async def batch_status(job_id: str):
+    return await get_batch_job(job_id)
+
+@app.get("/generate/batch/{job_id}/results")
+async def batch_results(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    job = await get_batch_job(job_id)
+    results = await batch_queue.results(job_id, offset, limit)
+    next_offset = offset + len(results)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "total": job["total"],
+        "offset": offset,
+        "next_offset": next_offset if next_offset < job["total"] else None,
+        "results": results
+    }
+
+@app.get("/generate/batch/{job_id}/results.ndjson")
+async def batch_results_ndjson(job_id: str, wait: bool = True):
+    await get_batch_job(job_id)
+
+    async def lines():
+        async for entry in batch_queue.iter_results(job_id, follow=wait):
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    for section, values in (await stats()).items():
+        for name, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                runtime_stats.set(value, section=section, name=name)
+    metrics = [stage_seconds, request_seconds, llm_tokens, errors_total, loop_lag, loop_lag_last, runtime_stats]
+    return PlainTextResponse(render(metrics), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,121 @@
+"""
+ShopSmart AI - Incremental parsing of model output
+
+The model answers with one JSON object whose interesting parts are the
+"items" and "menu" arrays. ArrayScanner is fed the completion text as it
+arrives and hands back every element of those arrays as soon as its
+closing bracket is seen, without waiting for the rest of the document.
+The same scanner lets salvage() recover every finished element from a
+completion that was cut off or is otherwise not valid JSON.
+"""
+
+import json
+import re
+from typing import List, Tuple
+
+TOTAL_COST_RE = re.compile(r'"total_cost"\s*:\s*"?(-?\d+(?:\.\d+)?)')
+NOTES_RE = re.compile(r'"notes"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class OutputParseError(Exception):
+    """Raised when nothing usable can be recovered from the model output."""
+
+
+class ArrayScanner:
+    def __init__(self, keys=("items", "menu")):
+        self.keys = set(keys)
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key = None
+        self._active_key = None
+        self._element_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        """Consume more text and return (key, element) pairs that became complete."""
+        self.buffer += chunk
+        found = []
+        buf = self.buffer
+        i = self._pos
+        while i < len(buf) and not self.done:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = buf[self._string_start + 1:i]
+            elif self._depth == 0:
+                # Skip code fences or any chatter before the document starts
+                if ch == "{":
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if self._depth == 1 and ch == "[" and self._last_key in self.keys:
+                    self._active_key = self._last_key
+                elif self._depth == 2 and self._active_key is not None:
+                    self._element_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._element_start is not None:
+                    try:
+                        found.append((self._active_key, json.loads(buf[self._element_start:i + 1])))
+                    except json.JSONDecodeError:
+                        pass
+                    self._element_start = None
+                elif self._depth == 1:
+                    self._active_key = None
+                elif self._depth == 0:
+                    self.done = True
+                    self._pos = i + 1
+                    return found
+            i += 1
+        self._pos = i
+        return found
+
+    def document(self) -> str:
+        """The text of the top-level object seen so far, without surrounding chatter."""
+        start = self.buffer.find("{")
+        if start < 0:
+            return ""
+        return self.buffer[start:self._pos] if self.done else self.buffer[start:]
+
+
+def extract_document(text: str) -> str:
+    """Strip code fences and chatter around the top-level JSON object."""
+    scanner = ArrayScanner(keys=())
+    scanner.feed(text)
+    return scanner.document()
+
+
+def salvage(text: str, keys=("items", "menu")) -> Tuple[dict, bool]:
+    """Recover finished array elements and top-level scalars from a broken document.
+
+    Returns the recovered data and whether the top-level object was closed,
+    i.e. False when the completion was cut off.
+    """
+    scanner = ArrayScanner(keys)
+    data = {key: [] for key in keys}
+    for key, value in scanner.feed(text):
+        data[key].append(value)
+
+    total = TOTAL_COST_RE.search(text)
+    if total:
+        data["total_cost"] = float(total.group(1))
+    notes = NOTES_RE.search(text)
+    if notes:
+        try:
+            data["notes"] = json.loads(f'"{notes.group(1)}"')
+        except json.JSONDecodeError:
+            pass
+    return data, scanner.done
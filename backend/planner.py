@@ -0,0 +1,122 @@
+"""
+ShopSmart AI - Multi-day menu planning
+
+Long menu plans are split into day ranges that are generated concurrently.
+The partial results are merged here: days are concatenated in order and
+shopping items bought in several ranges are folded into one line with the
+quantities, prices and nutrition added up.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+UNITS = {
+    "g": ("g", 1), "gr": ("g", 1), "gram": ("g", 1), "grams": ("g", 1), "г": ("g", 1),
+    "kg": ("g", 1000), "кг": ("g", 1000),
+    "ml": ("ml", 1), "мл": ("ml", 1),
+    "cl": ("ml", 10), "dl": ("ml", 100),
+    "l": ("ml", 1000), "liter": ("ml", 1000), "liters": ("ml", 1000), "litre": ("ml", 1000), "litres": ("ml", 1000), "л": ("ml", 1000),
+}
+
+QUANTITY_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*([^\d\s(]*)\s*(.*)$")
+
+NUTRIENTS = ("calories", "protein", "fat", "carbs")
+
+
+def number(value) -> float:
+    """Model output sometimes carries numbers as strings ("1.29") or null."""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def split_days(days: int, chunk_days: int) -> List[Tuple[int, int]]:
+    """Return (first day index, number of days) for each chunk."""
+    chunk_days = max(1, chunk_days)
+    return [(start, min(chunk_days, days - start)) for start in range(0, days, chunk_days)]
+
+
+def parse_quantity(quantity: str) -> Optional[Tuple[float, str, str]]:
+    """Split "1.5 kg" into (1500.0, "g", ""); counts keep their own label."""
+    match = QUANTITY_RE.match(quantity or "")
+    if not match:
+        return None
+    amount = float(match.group(1).replace(",", "."))
+    unit = match.group(2).strip(".").casefold()
+    if unit in UNITS:
+        base, factor = UNITS[unit]
+        return amount * factor, base, ""
+    # Anything else ("2 pcs", "3 Stück", "6") is a count of whatever the label says
+    label = " ".join(filter(None, (match.group(2), match.group(3))))
+    return amount, "count", label
+
+
+def format_quantity(amount: float, unit: str, label: str = "") -> str:
+    if unit == "g":
+        return f"{amount / 1000:g} kg" if amount >= 1000 else f"{amount:g} g"
+    if unit == "ml":
+        return f"{amount / 1000:g} l" if amount >= 1000 else f"{amount:g} ml"
+    return f"{amount:g} {label}".strip()
+
+
+def add_quantities(quantities: List[str]) -> str:
+    parsed = [parse_quantity(q) for q in quantities]
+    if all(parsed) and len({(p[1], p[2].casefold()) for p in parsed}) == 1:
+        _, unit, label = parsed[0]
+        return format_quantity(round(sum(p[0] for p in parsed), 3), unit, label)
+    # Mixed or unreadable units cannot be added safely, keep them side by side
+    return " + ".join(quantities)
+
+
+def merge_items(item_lists: List[List[dict]]) -> List[dict]:
+    """Fold identical products from the same store into one line, keeping first-seen order."""
+    merged = {}
+    quantities = {}
+    for items in item_lists:
+        for item in items:
+            key = (" ".join(str(item.get("product", "")).split()).casefold(), str(item.get("store", "")).strip().casefold())
+            if key not in merged:
+                merged[key] = dict(item)
+                quantities[key] = [str(item.get("quantity", ""))]
+                continue
+            line = merged[key]
+            quantities[key].append(str(item.get("quantity", "")))
+            line["approx_price"] = number(line.get("approx_price")) + number(item.get("approx_price"))
+            for field in NUTRIENTS:
+                line[field] = number(line.get(field)) + number(item.get(field))
+
+    result = []
+    for key, line in merged.items():
+        line["quantity"] = add_quantities(quantities[key])
+        line["approx_price"] = round(number(line.get("approx_price")), 2)
+        if "calories" in line:
+            line["calories"] = int(number(line["calories"]))
+        result.append(line)
+    return result
+
+
+def sum_nutrition(items: List[dict]) -> dict:
+    totals = {field: sum(number(item.get(field)) for item in items) for field in NUTRIENTS}
+    totals["calories"] = int(totals["calories"])
+    for field in ("protein", "fat", "carbs"):
+        totals[field] = round(totals[field], 1)
+    return totals
+
+
+def merge_chunks(chunks: List[dict], merge: bool = True) -> dict:
+    """Combine per-range results (in day order) into one plan; merge=False keeps duplicate lines."""
+    menu = [day for chunk in chunks for day in chunk.get("menu") or []]
+    item_lists = [chunk.get("items") or [] for chunk in chunks]
+    items = merge_items(item_lists) if merge else [item for items in item_lists for item in items]
+    notes = []
+    for chunk in chunks:
+        note = (chunk.get("notes") or "").strip()
+        if note and note not in notes:
+            notes.append(note)
+    return {
+        "menu": menu,
+        "items": items,
+        "total_cost": round(sum(number(item.get("approx_price")) for item in items), 2),
+        "notes": " ".join(notes),
+    }
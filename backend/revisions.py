@@ -0,0 +1,85 @@
+"""
+ShopSmart AI - Incremental revisions
+
+A revision sends the model the previous result and what changed in the
+request, and gets back only a delta: items to remove, replace or add and
+menu days to redo or append. Items and days are referred to by their number
+in the list the model was shown, since day names repeat in plans longer
+than a week. The delta is applied here to the stored result.
+"""
+
+from typing import List, Optional, Tuple
+
+MEALS = ("breakfast", "lunch", "dinner", "snack")
+
+
+def describe_changes(old: dict, new: dict) -> List[str]:
+    """Human-readable list of the request fields that changed."""
+    changes = []
+    if new["budget"] != old["budget"]:
+        changes.append(f"budget €{old['budget']} -> €{new['budget']}")
+    old_stores = {s.casefold(): s for s in old["supermarkets"]}
+    new_stores = {s.casefold(): s for s in new["supermarkets"]}
+    added = [s for k, s in new_stores.items() if k not in old_stores]
+    removed = [s for k, s in old_stores.items() if k not in new_stores]
+    if added:
+        changes.append(f"stores added: {', '.join(added)}")
+    if removed:
+        changes.append(f"stores removed: {', '.join(removed)} (replace their items)")
+    if (new["preferences"] or "").strip() != (old["preferences"] or "").strip():
+        changes.append(f"preferences '{old['preferences'] or 'None'}' -> '{new['preferences'] or 'None'}'")
+    if new["family_size"] != old["family_size"]:
+        changes.append(f"family size {old['family_size']} -> {new['family_size']} (adjust quantities)")
+    if new["mode"] == "menu" and (new["days"] or 7) != (old["days"] or 7):
+        changes.append(f"plan length {old['days'] or 7} -> {new['days'] or 7} days")
+    return changes
+
+
+def format_items(items: List[dict]) -> str:
+    return "\n".join(
+        f"{i}. {item['product']} | {item['quantity']} | {item['store']} | €{item['approx_price']} | {item['category']}"
+        for i, item in enumerate(items)
+    )
+
+
+def format_menu(menu: List[dict]) -> str:
+    return "\n".join(
+        f"{i}. {day['day']}: " + ", ".join(day[meal]["name"] for meal in MEALS if day.get(meal))
+        for i, day in enumerate(menu)
+    )
+
+
+def _index(value, size: int) -> Optional[int]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value):
+        return None
+    return int(value) if 0 <= value < size else None
+
+
+def apply_delta(items: List[dict], menu: Optional[List[dict]], delta: dict,
+                days: Optional[int] = None) -> Tuple[List[dict], Optional[List[dict]]]:
+    """Apply replace, then remove, then add; indexes refer to the list the model was shown.
+
+    Menu changes are {"index", "day"}: an index inside the menu redoes that
+    day, the next free index appends one, up to days in total. Elements in
+    delta are expected to be validated already.
+    """
+    items = [dict(item) for item in items]
+    for change in delta.get("replace") or []:
+        index = _index(change.get("index"), len(items))
+        if index is not None and change.get("item"):
+            items[index] = change["item"]
+    removed = {i for i in (_index(v, len(items)) for v in delta.get("remove") or []) if i is not None}
+    items = [item for i, item in enumerate(items) if i not in removed] + list(delta.get("add") or [])
+
+    if menu is not None or delta.get("menu"):
+        menu = list(menu or [])
+        shown = len(menu)
+        changes = delta.get("menu") or []
+        size = max(shown, days) if days is not None else shown + len(changes)
+        changes = [(_index(c.get("index"), size), c.get("day")) for c in changes]
+        for index, day in sorted((c for c in changes if c[0] is not None and c[1]), key=lambda c: c[0]):
+            if index < shown:
+                menu[index] = day
+            elif index == len(menu):
+                menu.append(day)
+    return items, menu
@@ -0,0 +1,129 @@
+"""
+ShopSmart AI - LLM request scheduler
+
+Caps the number of in-flight completions and keeps a bounded wait queue
+in front of them. Requests that cannot be served in time are rejected
+early with a Retry-After hint instead of piling up on the event loop.
+"""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Set inside reserve(): [units left] that completions of the admitted request take instead of admission
+_reserved: ContextVar[Optional[list]] = ContextVar("reserved", default=None)
+
+
+class SchedulerRejected(Exception):
+    """Raised when a request is shed instead of being scheduled."""
+
+    def __init__(self, reason: str, retry_after: int, status_code: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32, queue_timeout: float = 20.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._in_flight = 0
+        self._queued = 0
+        self._reserved = 0
+        # Exponentially weighted average of completion time, used for Retry-After
+        self._avg_service_time = 15.0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def reserved(self) -> int:
+        return self._reserved
+
+    def retry_after(self) -> int:
+        waves = (self._queued + self._in_flight + self._reserved) / self.max_concurrency
+        return max(1, math.ceil(waves * self._avg_service_time))
+
+    def admit(self, cost: int = 1):
+        """Reject right away unless cost slots or queue places are free."""
+        if self._in_flight + self._queued + self._reserved + cost > self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise SchedulerRejected("Too many pending requests", self.retry_after(), 429)
+
+    @contextmanager
+    def reserve(self, cost: int):
+        """Admit a request that fans out into cost completions once, up front.
+
+        The cost places stay held until a completion of the request takes
+        one or the block exits, so a request is shed before any work is done
+        instead of halfway through. Completions beyond cost are admitted
+        one by one as usual.
+        """
+        self.admit(cost)
+        self._reserved += cost
+        units = [cost]
+        token = _reserved.set(units)
+        try:
+            yield
+        finally:
+            _reserved.reset(token)
+            self._reserved -= units[0]
+            units[0] = 0
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        """Hold one completion slot for the duration of the block."""
+        units = _reserved.get()
+        if units and units[0] > 0:
+            units[0] -= 1
+            self._reserved -= 1
+        else:
+            self.admit()
+
+        deadline = self.queue_timeout if timeout is None else timeout
+        self._queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=deadline)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise SchedulerRejected("Timed out waiting for a free slot", self.retry_after(), 503)
+        finally:
+            self._queued -= 1
+
+        self._in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+            self._in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "reserved": self._reserved,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_service_time": round(self._avg_service_time, 3),
+        }
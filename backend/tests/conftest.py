@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The backend modules are imported flat, as uvicorn does from backend/
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "bench")
+sys.path.insert(0, BACKEND_DIR)
+
+# main reads its configuration on import; keep a local .env from pointing tests at real files or keys
+os.environ["OPENAI_API_KEY"] = "test"
+os.environ["CACHE_DB_PATH"] = ""
+os.environ["BATCH_DB_PATH"] = ":memory:"
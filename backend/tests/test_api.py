@@ -0,0 +1,269 @@
+import asyncio
+import json
+import sys
+
+import httpx
+import openai
+import pytest
+
+import main
+from metrics import Histogram
+from scheduler import LLMScheduler, SchedulerRejected
+from conftest import BENCH_DIR
+
+sys.path.insert(0, BENCH_DIR)
+import fake_openai  # noqa: E402
+
+REQUEST = {"supermarkets": ["Lidl", "Aldi"], "budget": 60.0, "family_size": 2, "fresh": True}
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Point the backend at bench/fake_openai.py in-process, answering instantly."""
+    def configure(*args):
+        monkeypatch.setattr(fake_openai, "config", fake_openai.parser.parse_args(["--ttft", "0", "--tokens-per-second", "0", *args]))
+        fake_openai.rng.seed(7)
+
+    configure()
+    transport = httpx.ASGITransport(app=fake_openai.app)
+    client = openai.AsyncOpenAI(api_key="test", base_url="http://fake/v1", max_retries=0,
+                                http_client=httpx.AsyncClient(transport=transport))
+    monkeypatch.setattr(main, "client", client)
+    return configure
+
+
+@pytest.fixture
+async def api():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+
+
+def events(text: str) -> list:
+    """(event, data) pairs of a Server-Sent Events body."""
+    parsed = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+@pytest.mark.parametrize("output_format", ["json", "compact"])
+async def test_generate_shopping_list(fake_llm, api, monkeypatch, output_format):
+    monkeypatch.setattr(main, "OUTPUT_FORMAT", output_format)
+
+    response = await api.post("/generate", json=REQUEST)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["items"]) >= 15
+    assert {item["store"] for item in data["items"]} <= {"Lidl", "Aldi"}
+    assert data["total_cost"] == round(sum(item["approx_price"] for item in data["items"]), 2)
+    assert data["total_nutrition"]["calories"] == sum(item["calories"] for item in data["items"])
+    assert data["generation_id"]
+
+
+async def test_generate_menu_in_day_ranges(fake_llm, api, monkeypatch):
+    monkeypatch.setattr(main, "MENU_CHUNK_DAYS", 3)
+
+    response = await api.post("/generate", json={**REQUEST, "mode": "menu", "days": 7})
+
+    assert response.status_code == 200
+    menu = response.json()["menu"]
+    assert [day["day"] for day in menu] == ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+async def test_generate_rejects_bad_days(api):
+    for days in (0, 15):
+        response = await api.post("/generate", json={**REQUEST, "mode": "menu", "days": days})
+        assert response.status_code == 422
+
+
+async def test_cut_off_answer_is_continued(fake_llm, api, monkeypatch):
+    fake_llm("--truncate-rate", "1")
+    monkeypatch.setattr(main, "MIN_ITEMS", 100)
+    before = dict(main.output_stats)
+
+    response = await api.post("/generate", json=REQUEST)
+
+    assert response.status_code == 200
+    assert main.output_stats["truncated"] > before["truncated"]
+    assert main.output_stats["continuations"] == before["continuations"] + 1
+    items = response.json()["items"]
+    assert len(items) > 0
+    assert response.json()["total_cost"] == round(sum(item["approx_price"] for item in items), 2)
+
+
+async def test_long_enough_cut_off_list_is_kept(fake_llm, api, monkeypatch):
+    fake_llm("--truncate-rate", "1")
+    monkeypatch.setattr(main, "MIN_ITEMS", 1)
+    before = dict(main.output_stats)
+
+    response = await api.post("/generate", json=REQUEST)
+
+    assert response.status_code == 200
+    assert main.output_stats["continuations"] == before["continuations"]
+
+
+async def test_shed_continuation_keeps_the_partial_answer(fake_llm, api, monkeypatch):
+    fake_llm("--truncate-rate", "1")
+    monkeypatch.setattr(main, "MIN_ITEMS", 100)
+
+    async def shed(*args):
+        raise SchedulerRejected("LLM queue is full", retry_after=1, status_code=429)
+
+    monkeypatch.setattr(main, "continue_items", shed)
+    before = dict(main.output_stats)
+
+    response = await api.post("/generate", json=REQUEST)
+
+    assert response.status_code == 200
+    assert len(response.json()["items"]) > 0
+    assert main.output_stats["continuation_failures"] == before["continuation_failures"] + 1
+
+
+@pytest.mark.parametrize("output_format", ["json", "compact"])
+def test_decode_output_times_parsing_once(monkeypatch, output_format):
+    monkeypatch.setattr(main, "OUTPUT_FORMAT", output_format)
+    monkeypatch.setattr(main, "stage_seconds", Histogram("t", "t", ("stage",)))
+    items = fake_openai.make_items(3, ["Lidl"], 20.0, output_format == "compact")
+    content = "```json\n" + json.dumps({"items": items, "total_cost": 20.0, "notes": ""}) + "\n```"
+
+    data, complete = main.decode_output(content, ["Lidl"])
+
+    assert complete and len(data["items"]) == 3
+    counts = [line for line in main.stage_seconds.samples() if line.startswith("t_count")]
+    assert counts == ['t_count{stage="parse"} 1', 't_count{stage="validate"} 1']
+
+
+async def test_stream_matches_stored_result(fake_llm, api, monkeypatch):
+    fake_llm("--truncate-rate", "1")
+    monkeypatch.setattr(main, "MIN_ITEMS", 100)
+
+    response = await api.post("/generate/stream", json=REQUEST)
+
+    sent = events(response.text)
+    assert sent[-1][0] == "summary"
+    items = [data for event, data in sent if event == "item"]
+    stored = await main.generation_store.get(sent[-1][1]["generation_id"])
+    # Lines sent before a continuation are never changed afterwards
+    assert stored["response"]["items"] == items
+    assert sent[-1][1]["total_cost"] == round(sum(item["approx_price"] for item in items), 2)
+
+
+async def test_stream_cache_hits_are_not_shed(fake_llm, api, monkeypatch):
+    request = {**REQUEST, "budget": 61.0, "fresh": False}
+    first = events((await api.post("/generate/stream", json=request)).text)
+    monkeypatch.setattr(main, "scheduler", LLMScheduler(max_concurrency=1, max_queue=0, queue_timeout=1))
+
+    # The only place is taken: every new completion is shed
+    with main.scheduler.reserve(1):
+        cached = await api.post("/generate/stream", json=request)
+        catalog = await api.post("/generate/stream", json={**request, "engine": "catalog"})
+        missed = await api.post("/generate/stream", json={**request, "budget": 62.0})
+
+    assert cached.status_code == 200
+    assert events(cached.text)[-1] == first[-1]
+    assert catalog.status_code == 200
+    assert events(catalog.text)[-1][0] == "summary"
+    assert missed.status_code == 429
+
+
+async def test_identical_streams_share_one_completion(fake_llm, api, monkeypatch):
+    fake_llm("--ttft", "0.05")
+    calls = 0
+    complete_stream = main.complete_stream
+
+    def counted(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return complete_stream(*args, **kwargs)
+
+    monkeypatch.setattr(main, "complete_stream", counted)
+    request = {**REQUEST, "budget": 63.0, "fresh": False}
+
+    responses = await asyncio.gather(*(api.post("/generate/stream", json=request) for _ in range(3)))
+
+    assert calls == 1
+    summaries = [events(response.text)[-1] for response in responses]
+    assert summaries[0][0] == "summary"
+    assert summaries == [summaries[0]] * 3
+    assert [e for e in events(responses[1].text) if e[0] == "item"] == [e for e in events(responses[0].text) if e[0] == "item"]
+
+
+async def test_stream_menu_in_day_ranges(fake_llm, api, monkeypatch):
+    monkeypatch.setattr(main, "MENU_CHUNK_DAYS", 3)
+    calls = []
+    chunk = main.generate_menu_chunk
+
+    async def counted(user_input, start, count, **kwargs):
+        calls.append((start, count))
+        return await chunk(user_input, start, count, **kwargs)
+
+    monkeypatch.setattr(main, "generate_menu_chunk", counted)
+
+    response = await api.post("/generate/stream", json={**REQUEST, "mode": "menu", "days": 7})
+
+    sent = events(response.text)
+    assert sorted(calls) == [(0, 3), (3, 3), (6, 1)]
+    days = [data["day"] for event, data in sent if event == "day"]
+    assert days == ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    stored = await main.generation_store.get(sent[-1][1]["generation_id"])
+    assert stored["response"]["items"] == [data for event, data in sent if event == "item"]
+    assert main.scheduler.reserved == 0
+
+
+async def test_revise_applies_delta(fake_llm, api):
+    first = (await api.post("/generate", json=REQUEST)).json()
+
+    response = await api.post(f"/generate/{first['generation_id']}/revise", json={"budget": 70.0})
+
+    assert response.status_code == 200
+    revised = response.json()
+    assert revised["generation_id"] != first["generation_id"]
+    # The fake delta removes item 0 and adds two items
+    assert revised["items"][:len(first["items"]) - 1] == first["items"][1:]
+    assert len(revised["items"]) == len(first["items"]) + 1
+    assert revised["notes"] == "Adjusted for the new request."
+
+
+async def test_revise_extends_a_menu(fake_llm, api, monkeypatch):
+    monkeypatch.setattr(main, "MENU_CHUNK_DAYS", 7)
+    first = (await api.post("/generate", json={**REQUEST, "mode": "menu", "days": 7})).json()
+
+    response = await api.post(f"/generate/{first['generation_id']}/revise", json={"days": 10})
+
+    menu = response.json()["menu"]
+    assert len(menu) == 10
+    assert menu[:7] == first["menu"]
+    assert [day["day"] for day in menu[7:]] == ["Monday", "Tuesday", "Wednesday"]
+
+
+async def test_revise_unknown_generation(api):
+    response = await api.post("/generate/unknown/revise", json={"budget": 70.0})
+    assert response.status_code == 404
+
+
+async def test_catalog_engine_skips_the_model(monkeypatch, api):
+    async def no_model(*args, **kwargs):
+        raise AssertionError("the catalog engine called the model")
+
+    monkeypatch.setattr(main, "complete", no_model)
+    first = await api.post("/generate", json={**REQUEST, "engine": "catalog"})
+    revised = await api.post(f"/generate/{first.json()['generation_id']}/revise", json={"budget": 90.0})
+
+    assert first.status_code == revised.status_code == 200
+    assert 0.85 * 90 <= revised.json()["total_cost"] <= 0.98 * 90
+
+
+async def test_metrics_endpoint(fake_llm, api):
+    await api.post("/generate", json=REQUEST)
+
+    response = await api.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "# TYPE shopsmart_llm_tokens_total counter" in text
+    assert 'shopsmart_llm_tokens_total{type="completion"}' in text
+    assert 'shopsmart_request_seconds_count{endpoint="generate",mode="shopping"}' in text
+    assert 'shopsmart_stage_seconds_bucket{stage="upstream_total",le="+Inf"}' in text
@@ -0,0 +1,182 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import main
+from batch import BatchQueue
+from scheduler import SchedulerRejected
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "batch.sqlite3")
+
+
+async def started(run, db_path, **kwargs) -> BatchQueue:
+    queue = BatchQueue(run, db_path, **kwargs)
+    await queue.start()
+    return queue
+
+
+async def finished(queue: BatchQueue, job_id: str) -> dict:
+    for _ in range(500):
+        job = await queue.job(job_id)
+        if job["status"] == "done":
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"batch {job_id} did not finish")
+
+
+async def test_duplicate_inputs_run_once(db_path):
+    calls = []
+
+    async def run(value):
+        calls.append(value["n"])
+        return {"n": value["n"]}
+
+    queue = await started(run, db_path)
+    job = await queue.submit(["a", "b", "a", "a"], [{"n": 1}, {"n": 2}, {"n": 1}, {"n": 1}])
+    assert (job["total"], job["unique"]) == (4, 2)
+
+    job = await finished(queue, job["job_id"])
+    await queue.stop()
+
+    assert sorted(calls) == [1, 2]
+    assert (job["done"], job["failed"], job["pending"]) == (2, 0, 0)
+
+
+async def test_results_keep_submission_order(db_path):
+    async def run(value):
+        # Later inputs finish first
+        await asyncio.sleep(0.01 * (3 - value["n"]))
+        return {"n": value["n"]}
+
+    queue = await started(run, db_path, concurrency=3)
+    job = await queue.submit(["a", "b", "c", "a"], [{"n": 0}, {"n": 1}, {"n": 2}, {"n": 0}])
+    await finished(queue, job["job_id"])
+
+    first = await queue.results(job["job_id"], 0, 3)
+    rest = await queue.results(job["job_id"], 3, 3)
+    await queue.stop()
+
+    assert [(e["index"], e["status"], e["result"]) for e in first + rest] == [
+        (0, "done", {"n": 0}), (1, "done", {"n": 1}), (2, "done", {"n": 2}), (3, "done", {"n": 0}),
+    ]
+
+
+async def test_follow_waits_for_entries_in_order(db_path):
+    gates = {n: asyncio.Event() for n in range(3)}
+
+    async def run(value):
+        await gates[value["n"]].wait()
+        return {"n": value["n"]}
+
+    queue = await started(run, db_path, concurrency=3)
+    job = await queue.submit(["a", "b", "c"], [{"n": 0}, {"n": 1}, {"n": 2}])
+    received = []
+
+    async def follow():
+        async for entry in queue.iter_results(job["job_id"], follow=True):
+            received.append(entry)
+
+    reader = asyncio.create_task(follow())
+    gates[2].set()
+    await asyncio.sleep(0.05)
+    # Entry 2 is done, but entry 0 is not: nothing may be sent out of order
+    assert received == []
+
+    gates[0].set()
+    await asyncio.sleep(0.05)
+    assert [e["index"] for e in received] == [0]
+
+    gates[1].set()
+    await asyncio.wait_for(reader, timeout=1)
+    await queue.stop()
+    assert [(e["index"], e["status"]) for e in received] == [(0, "done"), (1, "done"), (2, "done")]
+
+
+async def test_shed_tasks_retry_without_spending_attempts(db_path):
+    calls = 0
+
+    async def run(value):
+        nonlocal calls
+        calls += 1
+        if calls <= 3:
+            raise SchedulerRejected("LLM queue is full", retry_after=0, status_code=429)
+        return {"ok": True}
+
+    queue = await started(run, db_path, max_attempts=1)
+    job = await queue.submit(["a"], [{}])
+    job = await finished(queue, job["job_id"])
+    await queue.stop()
+
+    assert calls == 4
+    assert (job["done"], job["failed"]) == (1, 0)
+    assert (queue.retried, queue.completed) == (3, 1)
+
+
+async def test_failing_input_stops_after_max_attempts(db_path):
+    calls = 0
+
+    async def run(value):
+        nonlocal calls
+        calls += 1
+        raise ValueError("bad input")
+
+    queue = await started(run, db_path, max_attempts=2)
+    job = await queue.submit(["a"], [{}])
+    job = await finished(queue, job["job_id"])
+    results = await queue.results(job["job_id"])
+    await queue.stop()
+
+    assert calls == 2
+    assert (job["done"], job["failed"]) == (0, 1)
+    assert results[0]["status"] == "failed"
+    assert results[0]["error"] == "ValueError: bad input"
+    assert queue.failed == 1
+
+
+async def test_pending_tasks_resume_after_restart(db_path):
+    async def hang(value):
+        await asyncio.Event().wait()
+
+    queue = await started(hang, db_path)
+    job = await queue.submit(["a", "b"], [{"n": 0}, {"n": 1}])
+    await asyncio.sleep(0.01)
+    await queue.stop()
+
+    async def run(value):
+        return {"n": value["n"]}
+
+    queue = await started(run, db_path)
+    job = await finished(queue, job["job_id"])
+    results = await queue.results(job["job_id"])
+    await queue.stop()
+
+    assert job["done"] == 2
+    assert [e["result"] for e in results] == [{"n": 0}, {"n": 1}]
+
+
+async def test_batch_endpoints_page_and_stream(db_path, monkeypatch):
+    async def run(value):
+        return {"budget": value["budget"]}
+
+    queue = await started(run, db_path)
+    monkeypatch.setattr(main, "batch_queue", queue)
+    inputs = [{"supermarkets": ["Lidl"], "budget": budget, "family_size": 2} for budget in (40.0, 50.0, 40.0)]
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as api:
+        job = (await api.post("/generate/batch", json={"inputs": inputs})).json()
+        await finished(queue, job["job_id"])
+        first = (await api.get(f"/generate/batch/{job['job_id']}/results", params={"limit": 2})).json()
+        last = (await api.get(f"/generate/batch/{job['job_id']}/results", params={"offset": first["next_offset"]})).json()
+        lines = (await api.get(f"/generate/batch/{job['job_id']}/results.ndjson")).text.splitlines()
+        missing = await api.get("/generate/batch/unknown")
+    await queue.stop()
+
+    assert (first["next_offset"], last["next_offset"]) == (2, None)
+    assert [e["result"]["budget"] for e in first["results"] + last["results"]] == [40.0, 50.0, 40.0]
+    assert [json.loads(line)["index"] for line in lines] == [0, 1, 2]
+    assert missing.status_code == 404
@@ -0,0 +1,142 @@
+import asyncio
+
+from cache import ResponseCache, cache_key, canonical_input
+from main import UserInput
+
+
+def user_input(**fields):
+    return UserInput(**{"supermarkets": ["Lidl", "Aldi"], "budget": 50.0, **fields})
+
+
+def test_canonical_input_ignores_order_case_and_spacing():
+    a = user_input(supermarkets=["Lidl", "Aldi"], preferences="Vegan,  gluten free", language="EN")
+    b = user_input(supermarkets=[" aldi", "LIDL", ""], preferences="gluten free; vegan\n", language="en ")
+
+    assert canonical_input(a) == canonical_input(b)
+    assert canonical_input(a)["supermarkets"] == ["aldi", "lidl"]
+    assert canonical_input(a)["preferences"] == ["gluten free", "vegan"]
+    assert cache_key(a) == cache_key(b)
+
+
+def test_canonical_input_budget_bucket():
+    assert canonical_input(user_input(budget=49.6))["budget"] == 50
+    assert canonical_input(user_input(budget=52.4), budget_bucket=5)["budget"] == 50
+    assert canonical_input(user_input(budget=52.4), budget_bucket=0)["budget"] == 52
+    assert cache_key(user_input(budget=51)) != cache_key(user_input(budget=52))
+
+
+def test_canonical_input_days_only_count_for_menus():
+    assert canonical_input(user_input(days=3))["days"] is None
+    assert canonical_input(user_input(mode="menu", days=None))["days"] == 7
+    assert cache_key(user_input(mode="menu", days=3)) != cache_key(user_input(mode="menu", days=5))
+
+
+def test_canonical_input_keeps_result_changing_fields():
+    base = cache_key(user_input())
+    for changed in (dict(family_size=3), dict(language="de"), dict(mode="menu"), dict(engine="catalog")):
+        assert cache_key(user_input(**changed)) != base, changed
+    assert cache_key(user_input(fresh=True)) == base
+
+
+async def test_concurrent_misses_share_one_computation():
+    cache = ResponseCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"value": calls}
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    assert calls == 1
+    assert results == [{"value": 1}] * 5
+    assert cache.coalesced == 4
+    assert await cache.get_or_compute("k", compute) == {"value": 1}
+    assert await cache.get_or_compute("k", compute, bypass=True) == {"value": 2}
+
+
+async def test_failed_computation_is_not_cached():
+    cache = ResponseCache()
+
+    async def fail():
+        raise RuntimeError("upstream down")
+
+    async def succeed():
+        return {"ok": True}
+
+    for _ in range(2):
+        try:
+            await cache.get_or_compute("k", fail)
+        except RuntimeError:
+            pass
+    assert await cache.get_or_compute("k", succeed) == {"ok": True}
+
+
+async def test_waiters_take_over_when_the_leader_is_cancelled():
+    cache = ResponseCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"value": calls}
+
+    leader = asyncio.create_task(cache.get_or_compute("k", compute))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_compute("k", compute)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    results = await asyncio.gather(*waiters)
+
+    assert leader.cancelled()
+    assert calls == 2
+    assert results == [{"value": 2}] * 3
+    assert not cache._inflight
+
+
+async def test_cancelled_waiter_leaves_the_leader_running():
+    cache = ResponseCache()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return {"ok": True}
+
+    leader = asyncio.create_task(cache.get_or_compute("k", compute))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_compute("k", compute))
+    await asyncio.sleep(0)
+    waiter.cancel()
+
+    assert await leader == {"ok": True}
+    assert waiter.cancelled()
+
+
+async def test_lru_eviction_and_expiry():
+    cache = ResponseCache(max_entries=2)
+    await cache.set("a", {"v": "a"})
+    await cache.set("b", {"v": "b"})
+    await cache.get("a")
+    await cache.set("c", {"v": "c"})
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == {"v": "a"}
+
+    expired = ResponseCache(ttl=-1)
+    await expired.set("a", {"v": "a"})
+    assert await expired.get("a") is None
+
+
+async def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(db_path=path)
+    await cache.set("k", {"items": ["Milk"]})
+    cache.close()
+
+    restarted = ResponseCache(db_path=path)
+    assert await restarted.get("k") == {"items": ["Milk"]}
+    assert restarted.disk_hits == 1
+    restarted.close()
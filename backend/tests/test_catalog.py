@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+import catalog as catalog_module
+from catalog import TAG_BITS, Catalog, optimize
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return Catalog.load(os.path.join(os.path.dirname(catalog_module.__file__), "catalog.csv"))
+
+
+def name(catalog, row):
+    return None if row is None else catalog.names[catalog._product[row]][0]
+
+
+@pytest.mark.parametrize("product, expected", [
+    ("Bananas", "Bananas"),
+    ("Chicken breast 600 g", "Chicken breast"),
+    ("Organic bananas", "Bananas"),
+    ("Fresh chicken breast", "Chicken breast"),
+    ("Bio Milch 1 l", "Milk 1.5%"),
+    ("Milk 1.5%", "Milk 1.5%"),
+    ("Hähnchen", "Chicken breast"),
+])
+def test_match_exact_names(catalog, product, expected):
+    assert name(catalog, catalog.match(product, "Lidl")) == expected
+
+
+@pytest.mark.parametrize("product", [
+    "Chicken soup 400 g",
+    "Chicken nuggets 750 g",
+    "Potato chips 200 g",
+    "Tomato sauce",
+    "Banana bread",
+    "Rice cakes",
+    "Almond milk",
+    "Soy milk",
+    "Olive oil",
+    "Goat cheese",
+    "Turkey sausages",
+    "Sweet potatoes 1 kg",
+    "Greek yogurt",
+    "Smoked salmon",
+])
+def test_match_rejects_other_products(catalog, product):
+    assert catalog.match(product, "Lidl") is None
+
+
+def test_match_unknown_store(catalog):
+    assert catalog.match("Bananas", "Netto") is None
+
+
+def test_snap_prices_whole_packs(catalog):
+    items = [
+        {"product": "Chicken breast", "quantity": "1.2 kg", "store": "Lidl", "approx_price": 1.0, "category": "meat"},
+        {"product": "Chicken nuggets", "quantity": "750 g", "store": "Lidl", "approx_price": 4.5, "category": "frozen"},
+    ]
+    row = catalog.match("Chicken breast", "Lidl")
+    packs = catalog.packs(row, "1.2 kg")
+
+    assert catalog.snap(items) == 1
+    assert items[0]["approx_price"] == round(packs * catalog.price[row], 2)
+    assert items[1]["approx_price"] == 4.5
+
+
+def test_optimize_unknown_store(catalog):
+    assert optimize(catalog, ["Netto"], 50) is None
+
+
+@pytest.mark.parametrize("stores, budget, family, preferences", [
+    (["Lidl"], 80, 3, "vegan"),
+    (["Aldi", "Rewe"], 50, 2, ""),
+    (["Edeka"], 150, 5, "vegetarian, gluten-free"),
+])
+def test_optimize_stays_in_budget(catalog, stores, budget, family, preferences):
+    items = optimize(catalog, stores, budget, family, preferences)
+    total = sum(item["approx_price"] for item in items)
+
+    assert total <= 0.98 * budget
+    assert {item["store"] for item in items} <= set(stores)
+
+
+def test_optimize_caps_non_food_and_pantry(catalog):
+    items = optimize(catalog, ["Lidl"], 80, 3, "vegan")
+    by_product = {item["product"]: item for item in items}
+    base = round(3 / 2)
+
+    for item in items:
+        row = catalog.match(item["product"], "Lidl")
+        packs = catalog.packs(row, item["quantity"])
+        if catalog.tags[row] & TAG_BITS["non_food"]:
+            assert packs == 1, item
+        elif item["category"] == "pantry":
+            assert packs <= base, item
+    assert by_product["Wheat flour"]["quantity"] == "2 kg"
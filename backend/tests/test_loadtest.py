@@ -0,0 +1,23 @@
+import os
+import shlex
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BENCH_DIR
+
+# Fast fake model, so the gates measure the backend's own overhead and event-loop lag
+DEFAULT_ARGS = "--requests 40 --concurrency 10 --formats json,compact --fake-args '--ttft 0.05 --tokens-per-second 0' --max-p95 2.0 --max-loop-lag 0.1"
+
+pytestmark = [
+    pytest.mark.loadtest,
+    pytest.mark.skipif(os.getenv("RUN_LOADTEST") != "1", reason="set RUN_LOADTEST=1 to run the latency gates"),
+]
+
+
+def test_latency_gates():
+    args = shlex.split(os.getenv("LOADTEST_ARGS", DEFAULT_ARGS))
+    result = subprocess.run([sys.executable, os.path.join(BENCH_DIR, "loadtest.py"), *args],
+                            capture_output=True, text=True, timeout=1200)
+    assert result.returncode == 0, result.stdout + result.stderr
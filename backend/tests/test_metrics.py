@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, LoopLagMonitor, Metric, render, timed
+
+
+def test_counter_and_gauge_render():
+    counter = Counter("shopsmart_errors_total", "Failed requests", ("type",))
+    counter.inc(type="OutputParseError")
+    counter.inc(2, type='Bad "quote"\n')
+    gauge = Gauge("shopsmart_runtime", "Counters", ("section", "name"))
+    gauge.set(1.5, section="cache", name="hits")
+
+    assert render([counter, gauge]) == (
+        "# HELP shopsmart_errors_total Failed requests\n"
+        "# TYPE shopsmart_errors_total counter\n"
+        'shopsmart_errors_total{type="Bad \\"quote\\"\\n"} 2\n'
+        'shopsmart_errors_total{type="OutputParseError"} 1\n'
+        "# HELP shopsmart_runtime Counters\n"
+        "# TYPE shopsmart_runtime gauge\n"
+        'shopsmart_runtime{section="cache",name="hits"} 1.5\n'
+    )
+
+
+def test_metric_kinds_must_render_samples():
+    with pytest.raises(TypeError):
+        Metric("shopsmart_unknown", "No samples")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("shopsmart_stage_seconds", "Stages", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, stage="parse")
+
+    assert histogram.samples() == [
+        'shopsmart_stage_seconds_bucket{stage="parse",le="0.1"} 1',
+        'shopsmart_stage_seconds_bucket{stage="parse",le="1"} 3',
+        'shopsmart_stage_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'shopsmart_stage_seconds_sum{stage="parse"} 4.25',
+        'shopsmart_stage_seconds_count{stage="parse"} 4',
+    ]
+
+
+def test_timed_as_block_and_decorator():
+    histogram = Histogram("t", "t", ("stage",))
+
+    with timed(histogram, stage="block"):
+        pass
+
+    @timed(histogram, stage="call")
+    def work(x):
+        return x * 2
+
+    assert work(2) == 4 and work(3) == 6
+    samples = histogram.samples()
+    assert 't_count{stage="block"} 1' in samples
+    assert 't_count{stage="call"} 2' in samples
+
+
+async def test_loop_lag_monitor_sees_blocking_work():
+    histogram = Histogram("lag", "lag", buckets=(0.01, 0.1))
+    gauge = Gauge("lag_last", "lag")
+    monitor = LoopLagMonitor(histogram, gauge, interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.02)
+    # Blocks the loop, so the monitor's sleep overshoots by about this much
+    time.sleep(0.05)
+    await asyncio.sleep(0.02)
+    await monitor.stop()
+
+    assert 'lag_bucket{le="0.1"}' in render([histogram])
+    assert histogram._values[()][-1] >= 0.03
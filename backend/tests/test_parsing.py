@@ -0,0 +1,79 @@
+import json
+
+from parsing import ArrayScanner, extract_document, salvage
+
+DOCUMENT = json.dumps({
+    "items": [
+        {"product": "Milk", "quantity": "1 l", "store": "Lidl", "approx_price": 0.99, "category": "dairy"},
+        {"product": "Bread [sliced]", "quantity": "500 g", "store": "Aldi", "approx_price": 1.49, "category": "bread"},
+        {"product": "Say \"cheese\"", "quantity": "200 g", "store": "Lidl", "approx_price": 2.19, "category": "dairy"},
+    ],
+    "total_cost": 4.67,
+    "notes": "Buy \"fresh\" {vegetables}.",
+    "menu": [{"day": "Monday", "breakfast": {"name": "Oats", "description": "x"}}],
+})
+
+
+def test_scanner_yields_each_element_when_it_closes():
+    scanner = ArrayScanner()
+    seen = []
+    for i, ch in enumerate(DOCUMENT):
+        for key, element in scanner.feed(ch):
+            seen.append((key, element, i))
+
+    expected = json.loads(DOCUMENT)
+    assert [(k, e) for k, e, _ in seen] == [("items", item) for item in expected["items"]] + [("menu", expected["menu"][0])]
+    # Every element is handed out at its own closing brace, long before the document ends
+    first_close = DOCUMENT.index("}")
+    assert seen[0][2] == first_close
+    assert scanner.done
+
+
+def test_scanner_ignores_other_arrays_and_nested_brackets():
+    text = '{"tags": [{"a": 1}], "items": [{"product": "x", "sizes": [1, 2], "more": {"k": "]"}}]}'
+    scanner = ArrayScanner()
+    assert scanner.feed(text) == [("items", {"product": "x", "sizes": [1, 2], "more": {"k": "]"}})]
+
+
+def test_scanner_skips_chatter_and_code_fences():
+    text = "Here you go:\n```json\n" + DOCUMENT + "\n```\nEnjoy!"
+    scanner = ArrayScanner()
+    assert len(scanner.feed(text)) == 4
+    assert scanner.document() == DOCUMENT
+    assert extract_document(text) == DOCUMENT
+
+
+def test_scanner_drops_malformed_element_and_continues():
+    text = '{"items": [{"product": "x",}, {"product": "y"}]}'
+    assert ArrayScanner().feed(text) == [("items", {"product": "y"})]
+
+
+def test_salvage_cut_off_document():
+    cut = DOCUMENT[:DOCUMENT.index("Say")]
+    data, complete = salvage(cut)
+
+    assert not complete
+    assert [item["product"] for item in data["items"]] == ["Milk", "Bread [sliced]"]
+    assert data["menu"] == []
+    assert "total_cost" not in data
+
+
+def test_salvage_recovers_scalars():
+    data, complete = salvage(DOCUMENT[:-20])
+
+    assert not complete
+    assert len(data["items"]) == 3
+    assert data["total_cost"] == 4.67
+    assert data["notes"] == 'Buy "fresh" {vegetables}.'
+
+
+def test_salvage_complete_document():
+    data, complete = salvage(DOCUMENT)
+    assert complete
+    assert len(data["items"]) == 3 and len(data["menu"]) == 1
+
+
+def test_salvage_nothing_usable():
+    data, complete = salvage("Sorry, I cannot help with that.")
+    assert not complete
+    assert data == {"items": [], "menu": []}
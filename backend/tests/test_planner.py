@@ -0,0 +1,83 @@
+import copy
+
+import pytest
+
+from planner import add_quantities, merge_chunks, merge_items, parse_quantity, split_days, sum_nutrition
+
+
+@pytest.mark.parametrize("quantity, expected", [
+    ("1.5 kg", (1500.0, "g", "")),
+    ("500 g", (500.0, "g", "")),
+    ("1,5 l", (1500.0, "ml", "")),
+    ("330ml", (330.0, "ml", "")),
+    ("2 кг", (2000.0, "g", "")),
+    ("6 pcs", (6.0, "count", "pcs")),
+    ("3 Stück", (3.0, "count", "Stück")),
+    ("10", (10.0, "count", "")),
+    ("", None),
+    ("a few", None),
+])
+def test_parse_quantity(quantity, expected):
+    assert parse_quantity(quantity) == expected
+
+
+@pytest.mark.parametrize("quantities, expected", [
+    (["500 g", "750 g"], "1.25 kg"),
+    (["1 l", "500 ml"], "1.5 l"),
+    (["6 pcs", "4 pcs"], "10 pcs"),
+    (["500 g", "2 pcs"], "500 g + 2 pcs"),
+    (["1 bunch", "some"], "1 bunch + some"),
+])
+def test_add_quantities(quantities, expected):
+    assert add_quantities(quantities) == expected
+
+
+def item(product, store, quantity, price, calories=100, protein=1.0):
+    return {"product": product, "quantity": quantity, "store": store, "approx_price": price, "category": "dairy",
+            "calories": calories, "protein": protein, "fat": 0.0, "carbs": 0.0}
+
+
+def test_merge_items_folds_same_product_and_store():
+    first = [item("Milk", "Lidl", "1 l", 0.99), item("Eggs", "Aldi", "10 pcs", 2.29)]
+    second = [item(" milk ", "lidl", "500 ml", "0.55", calories=50), item("Milk", "Rewe", "1 l", 1.19)]
+    before = copy.deepcopy([first, second])
+
+    merged = merge_items([first, second])
+
+    assert [(i["product"], i["store"]) for i in merged] == [("Milk", "Lidl"), ("Eggs", "Aldi"), ("Milk", "Rewe")]
+    assert merged[0]["quantity"] == "1.5 l"
+    assert merged[0]["approx_price"] == 1.54
+    assert merged[0]["calories"] == 150
+    assert merged[0]["protein"] == 2.0
+    assert [first, second] == before
+
+
+def test_merge_items_tolerates_missing_numbers():
+    merged = merge_items([[item("Milk", "Lidl", "1 l", None)], [item("Milk", "Lidl", "1 l", "n/a")]])
+    assert merged[0]["approx_price"] == 0.0
+
+
+def test_split_days():
+    assert split_days(7, 4) == [(0, 4), (4, 3)]
+    assert split_days(3, 4) == [(0, 3)]
+    assert split_days(2, 0) == [(0, 1), (1, 1)]
+
+
+def test_merge_chunks():
+    chunks = [
+        {"menu": [{"day": "Monday"}], "items": [item("Milk", "Lidl", "1 l", 1.0)], "notes": "Cook twice."},
+        {"menu": [{"day": "Tuesday"}], "items": [item("Milk", "Lidl", "1 l", 1.0), item("Eggs", "Lidl", "6 pcs", 1.5)], "notes": "Cook twice."},
+    ]
+
+    merged = merge_chunks(chunks)
+    kept = merge_chunks(chunks, merge=False)
+
+    assert [d["day"] for d in merged["menu"]] == ["Monday", "Tuesday"]
+    assert len(merged["items"]) == 2 and merged["total_cost"] == 3.5
+    assert merged["notes"] == "Cook twice."
+    assert len(kept["items"]) == 3 and kept["total_cost"] == 3.5
+
+
+def test_sum_nutrition():
+    totals = sum_nutrition([item("Milk", "Lidl", "1 l", 1.0, 640, 34.0), item("Oats", "Lidl", "500 g", 1.0, 1860, 67.04)])
+    assert totals == {"calories": 2500, "protein": 101.0, "fat": 0.0, "carbs": 0.0}
@@ -0,0 +1,93 @@
+import copy
+
+from revisions import apply_delta, describe_changes
+
+
+def items(*names):
+    return [{"product": n, "quantity": "1 pcs", "store": "Lidl", "approx_price": 1.0, "category": "pantry"} for n in names]
+
+
+def day(name, dinner="Soup"):
+    meal = {"name": dinner, "description": "", "calories": 500}
+    return {"day": name, "breakfast": meal, "lunch": meal, "dinner": meal, "snack": None}
+
+
+def test_apply_delta_uses_indexes_of_the_shown_list():
+    old = items("A", "B", "C", "D")
+    before = copy.deepcopy(old)
+    delta = {
+        "replace": [{"index": 2, "item": items("C2")[0]}],
+        "remove": [0, 3],
+        "add": items("E"),
+    }
+
+    new, menu = apply_delta(old, None, delta)
+
+    assert [i["product"] for i in new] == ["B", "C2", "E"]
+    assert menu is None
+    assert old == before
+
+
+def test_apply_delta_ignores_invalid_indexes():
+    delta = {
+        "replace": [{"index": 9, "item": items("X")[0]}, {"index": 0, "item": None}],
+        "remove": [-1, 1.5, True, "0", 5, 1.0],
+    }
+    new, _ = apply_delta(items("A", "B", "C"), None, delta)
+    assert [i["product"] for i in new] == ["A", "C"]
+
+
+def test_apply_delta_redoes_and_appends_days_by_position():
+    menu = [day("Monday"), day("Tuesday")]
+    delta = {"menu": [{"index": 3, "day": day("Thursday")}, {"index": 1, "day": day("Tuesday", "Curry")},
+                      {"index": 2, "day": day("Wednesday")}, {"index": 7, "day": day("Gap")}]}
+
+    _, new = apply_delta([], menu, delta, days=4)
+
+    assert [d["day"] for d in new] == ["Monday", "Tuesday", "Wednesday", "Thursday"]
+    assert new[1]["dinner"]["name"] == "Curry"
+    assert menu[1]["dinner"]["name"] == "Soup"
+
+
+def test_extending_a_week_appends_the_new_days():
+    week = [day(name) for name in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")]
+    delta = {"menu": [{"index": i, "day": day(name, "New")} for i, name in ((7, "Monday"), (8, "Tuesday"), (9, "Wednesday"))]}
+
+    _, new = apply_delta([], week, delta, days=10)
+
+    assert len(new) == 10
+    assert new[:7] == week
+    assert [d["day"] for d in new[7:]] == ["Monday", "Tuesday", "Wednesday"]
+
+
+def test_repeated_day_names_are_told_apart():
+    two_weeks = [day(name) for name in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday") * 2]
+
+    _, new = apply_delta([], two_weeks, {"menu": [{"index": 0, "day": day("Monday", "Curry")}]}, days=14)
+
+    assert new[0]["dinner"]["name"] == "Curry"
+    assert new[7]["dinner"]["name"] == "Soup"
+
+
+def test_apply_delta_ignores_days_past_the_limit():
+    _, new = apply_delta([], [day("Monday")], {"menu": [{"index": 1, "day": day("Tuesday")}]}, days=1)
+    assert [d["day"] for d in new] == ["Monday"]
+
+
+def test_apply_empty_delta():
+    old = items("A")
+    assert apply_delta(old, None, {}) == (old, None)
+
+
+def test_describe_changes():
+    old = {"budget": 50.0, "supermarkets": ["Lidl", "Aldi"], "preferences": "", "family_size": 2, "mode": "menu", "days": 7}
+    new = {"budget": 60.0, "supermarkets": ["lidl", "Rewe"], "preferences": " ", "family_size": 3, "mode": "menu", "days": 5}
+
+    assert describe_changes(old, new) == [
+        "budget €50.0 -> €60.0",
+        "stores added: Rewe",
+        "stores removed: Aldi (replace their items)",
+        "family size 2 -> 3 (adjust quantities)",
+        "plan length 7 -> 5 days",
+    ]
+    assert describe_changes(old, dict(old)) == []
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from scheduler import LLMScheduler, SchedulerRejected
+
+
+async def hold(scheduler, started: asyncio.Event, release: asyncio.Event):
+    async with scheduler.slot():
+        started.set()
+        await release.wait()
+
+
+async def test_rejects_when_slots_and_queue_are_full():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=1, queue_timeout=5)
+    release = asyncio.Event()
+    running = asyncio.Event()
+    first = asyncio.create_task(hold(scheduler, running, release))
+    await running.wait()
+    second = asyncio.create_task(hold(scheduler, asyncio.Event(), release))
+    await asyncio.sleep(0)
+
+    assert (scheduler.in_flight, scheduler.queued) == (1, 1)
+    with pytest.raises(SchedulerRejected) as rejected:
+        async with scheduler.slot():
+            pass
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after >= 1
+    assert scheduler.rejected == 1
+
+    release.set()
+    await asyncio.gather(first, second)
+    assert scheduler.completed == 2
+    assert (scheduler.in_flight, scheduler.queued) == (0, 0)
+
+
+async def test_queue_timeout_sheds_with_503():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=1, queue_timeout=0.01)
+    release, running = asyncio.Event(), asyncio.Event()
+    first = asyncio.create_task(hold(scheduler, running, release))
+    await running.wait()
+
+    with pytest.raises(SchedulerRejected) as rejected:
+        async with scheduler.slot():
+            pass
+    assert rejected.value.status_code == 503
+    assert scheduler.timed_out == 1
+    assert scheduler.queued == 0
+
+    release.set()
+    await first
+
+
+async def test_concurrent_reservations_share_the_capacity():
+    scheduler = LLMScheduler(max_concurrency=2, max_queue=2, queue_timeout=5)
+    release = asyncio.Event()
+    peak = 0
+
+    async def chunk():
+        nonlocal peak
+        async with scheduler.slot():
+            peak = max(peak, scheduler.in_flight + scheduler.queued + scheduler.reserved)
+            await release.wait()
+
+    async def fan_out():
+        with scheduler.reserve(2):
+            await asyncio.gather(chunk(), chunk())
+
+    tasks = [asyncio.create_task(fan_out()) for _ in range(10)]
+    await asyncio.sleep(0.01)
+    # Two fan-outs hold all four places; the others are shed before any of their chunks start
+    assert scheduler.in_flight + scheduler.queued + scheduler.reserved == 4
+    assert scheduler.rejected == 8
+    with pytest.raises(SchedulerRejected):
+        async with scheduler.slot():
+            pass
+
+    release.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert sum(isinstance(r, SchedulerRejected) for r in results) == 8
+    assert peak <= 4
+    assert scheduler.completed == 4
+    assert (scheduler.in_flight, scheduler.queued, scheduler.reserved) == (0, 0, 0)
+
+
+async def test_reservation_held_until_taken_or_released():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=1, queue_timeout=5)
+
+    with scheduler.reserve(2):
+        assert scheduler.reserved == 2
+        with pytest.raises(SchedulerRejected):
+            scheduler.admit()
+        async with scheduler.slot():
+            assert (scheduler.reserved, scheduler.in_flight) == (1, 1)
+    # The unused place is given back when the block exits
+    assert scheduler.reserved == 0
+    scheduler.admit(2)
+
+    with pytest.raises(SchedulerRejected):
+        with scheduler.reserve(3):
+            pass
+    assert scheduler.reserved == 0
+
+
+async def test_completions_beyond_the_reservation_are_admitted():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=0, queue_timeout=5)
+
+    with scheduler.reserve(1):
+        async with scheduler.slot():
+            pass
+        async with scheduler.slot():
+            pass
+    assert scheduler.completed == 2
+
+
+async def test_reserve_is_scoped_to_the_request():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=0, queue_timeout=5)
+    release, running = asyncio.Event(), asyncio.Event()
+
+    async def reserved():
+        with scheduler.reserve(1):
+            await hold(scheduler, running, release)
+
+    task = asyncio.create_task(reserved())
+    await running.wait()
+    with pytest.raises(SchedulerRejected):
+        async with scheduler.slot():
+            pass
+    release.set()
+    await task
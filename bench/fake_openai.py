@@ -0,0 +1,184 @@
+"""
+ShopSmart AI - Fake OpenAI server for benchmarks
+
+Serves POST /v1/chat/completions (plain and streamed) with shopping lists,
+meal plans and revision deltas in the format the backend asked for. Latency,
+token rate, truncation and errors are configurable, so load tests measure
+the backend instead of the real API.
+
+    python bench/fake_openai.py --port 9100 --ttft 0.4 --tokens-per-second 120
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_API_KEY=fake uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CATEGORIES = ["vegetables", "fruits", "meat", "fish", "dairy", "bread", "beverages", "snacks", "frozen", "pantry", "cleaning", "hygiene"]
+PRODUCTS = [
+    ("Tomatoes", "1 kg", 0, 180, 9.0, 2.0, 39.0), ("Carrots", "1 kg", 0, 410, 9.0, 2.4, 96.0),
+    ("Potatoes", "2.5 kg", 0, 1925, 50.0, 2.5, 425.0), ("Onions", "1 kg", 0, 400, 11.0, 1.0, 93.0),
+    ("Bananas", "1 kg", 1, 890, 11.0, 3.3, 228.0), ("Apples", "1.5 kg", 1, 780, 4.0, 2.5, 207.0),
+    ("Chicken breast", "600 g", 2, 990, 186.0, 21.6, 0.0), ("Minced beef", "500 g", 2, 1270, 95.0, 100.0, 0.0),
+    ("Salmon fillet", "250 g", 3, 520, 50.0, 33.0, 0.0), ("Milk", "1 l", 4, 640, 34.0, 35.0, 48.0),
+    ("Gouda", "400 g", 4, 1420, 100.0, 108.0, 0.0), ("Yogurt", "500 g", 4, 305, 17.0, 17.0, 20.0),
+    ("Whole grain bread", "500 g", 5, 1100, 40.0, 7.0, 205.0), ("Mineral water", "6 x 1.5 l", 6, 0, 0.0, 0.0, 0.0),
+    ("Orange juice", "1 l", 6, 450, 7.0, 2.0, 104.0), ("Dark chocolate", "100 g", 7, 550, 8.0, 36.0, 40.0),
+    ("Frozen spinach", "450 g", 8, 104, 13.0, 1.8, 5.0), ("Pasta", "500 g", 9, 1780, 62.0, 7.5, 355.0),
+    ("Rice", "1 kg", 9, 3500, 70.0, 6.0, 780.0), ("Oats", "500 g", 9, 1860, 67.0, 35.0, 295.0),
+    ("Eggs", "10 pcs", 4, 780, 65.0, 55.0, 5.0), ("Olive oil", "500 ml", 9, 4100, 0.0, 455.0, 0.0),
+    ("Dish soap", "500 ml", 10, 0, 0.0, 0.0, 0.0), ("Toothpaste", "75 ml", 11, 0, 0.0, 0.0, 0.0),
+]
+MEALS = [("Oatmeal with berries", 350), ("Chicken rice bowl", 620), ("Pasta with tomato sauce", 580),
+         ("Salmon with potatoes", 650), ("Vegetable omelette", 420), ("Yogurt with banana", 200)]
+
+parser = argparse.ArgumentParser(description="Fake OpenAI chat-completions server")
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=9100)
+parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+parser.add_argument("--jitter", type=float, default=0.2, help="random +/- share applied to every delay")
+parser.add_argument("--tokens-per-second", type=float, default=150.0, help="0 sends the whole answer at once")
+parser.add_argument("--chunk-tokens", type=int, default=4, help="tokens per streamed chunk")
+parser.add_argument("--items", type=int, default=20, help="shopping items per answer")
+parser.add_argument("--truncate-rate", type=float, default=0.0, help="share of answers cut off with finish_reason=length")
+parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+parser.add_argument("--seed", type=int, default=None)
+
+app = FastAPI(title="Fake OpenAI")
+config = parser.parse_args([])
+rng = random.Random()
+
+
+def tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def delay(seconds: float) -> float:
+    return max(0.0, seconds * (1 + rng.uniform(-config.jitter, config.jitter)))
+
+
+def make_items(count: int, stores: list, budget: float, compact: bool) -> list:
+    picks = [rng.choice(PRODUCTS) for _ in range(count)]
+    weights = [rng.uniform(0.5, 1.5) for _ in picks]
+    scale = budget * 0.9 / sum(weights)
+    items = []
+    for (product, quantity, category, calories, protein, fat, carbs), weight in zip(picks, weights):
+        store = rng.randrange(len(stores))
+        price = round(weight * scale, 2)
+        if compact:
+            items.append([product, quantity, store, price, category, calories, protein, fat, carbs])
+        else:
+            items.append({"product": product, "quantity": quantity, "store": stores[store], "approx_price": price,
+                          "category": CATEGORIES[category], "calories": calories, "protein": protein, "fat": fat, "carbs": carbs})
+    return items
+
+
+def make_day(name: str, compact: bool):
+    meals = [rng.choice(MEALS) for _ in range(4)]
+    if compact:
+        return [name, *[[meal, "Quick and simple", calories] for meal, calories in meals]]
+    day = {"day": name}
+    for slot, (meal, calories) in zip(("breakfast", "lunch", "dinner", "snack"), meals):
+        day[slot] = {"name": meal, "description": "Quick and simple", "calories": calories}
+    return day
+
+
+def answer(messages: list) -> str:
+    """Build an answer shaped like the one the prompt asks for."""
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in messages if m["role"] == "user"), "")
+    compact = "Each item is a row" in system
+    stores = re.search(r"Supermarkets: (.*)", user)
+    stores = [s.strip() for s in stores.group(1).split(",")] if stores else ["Lidl"]
+    budget = re.search(r"Budget(?: left)?: €([\d.]+)", user)
+    budget = float(budget.group(1)) if budget else 50.0
+    more = re.search(r"Generate (\d+) more items", user)
+    count = int(more.group(1)) if more else config.items
+
+    if "Update their existing" in system:
+        add = make_items(2, stores, budget * 0.1, compact)
+        delta = {"remove": [0], "add": add, "notes": "Adjusted for the new request."}
+        new_days = re.search(r"Add these days to the menu: (.*)", user)
+        if new_days:
+            delta["menu"] = [{"index": int(i), "day": make_day(name.strip(), compact)} for i, name in re.findall(r"(\d+)\. ([^,]+)", new_days.group(1))]
+        return json.dumps(delta, ensure_ascii=False)
+
+    items = make_items(count, stores, budget, compact)
+    data = {"items": items, "total_cost": round(sum((i[3] if compact else i["approx_price"]) for i in items), 2), "notes": "Fake answer."}
+    days = re.search(r"Days: (.*)", system)
+    if days and "Add the products" not in user:
+        data = {"menu": [make_day(d.strip(), compact) for d in days.group(1).split(",")], **data}
+    return json.dumps(data, ensure_ascii=False)
+
+
+def error(status: int, message: str, kind: str) -> JSONResponse:
+    return JSONResponse({"error": {"message": message, "type": kind, "param": None, "code": None}}, status_code=status)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    roll = rng.random()
+    if roll < config.error_rate:
+        await asyncio.sleep(delay(config.ttft))
+        return error(500, "Injected server error", "server_error")
+    if roll < config.error_rate + config.rate_limit_rate:
+        return error(429, "Injected rate limit", "rate_limit_exceeded")
+
+    messages = body.get("messages", [])
+    content = answer(messages)
+    finish = "stop"
+    limit = body.get("max_tokens")
+    if limit and tokens(content) > limit:
+        content, finish = content[:limit * 4], "length"
+    elif rng.random() < config.truncate_rate:
+        content, finish = content[:int(len(content) * rng.uniform(0.4, 0.9))], "length"
+
+    usage = {"prompt_tokens": sum(tokens(m.get("content", "")) for m in messages), "completion_tokens": tokens(content)}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = body.get("model", "gpt-4o-mini")
+    rate = config.tokens_per_second
+
+    if not body.get("stream"):
+        await asyncio.sleep(delay(config.ttft) + (delay(tokens(content) / rate) if rate > 0 else 0))
+        return {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish}],
+            "usage": usage,
+        }
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def events():
+        await asyncio.sleep(delay(config.ttft))
+        size = max(1, config.chunk_tokens) * 4
+        for i in range(0, len(content), size):
+            yield chunk({"role": "assistant", "content": content[i:i + size]} if i == 0 else {"content": content[i:i + size]})
+            if rate > 0:
+                await asyncio.sleep(delay(config.chunk_tokens / rate))
+        yield chunk({}, finish)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    rng.seed(config.seed)
+    uvicorn.run(app, host=config.host, port=config.port, log_level="warning")
@@ -0,0 +1,280 @@
+"""
+ShopSmart AI - Load test
+
+Sends concurrent /generate requests in shopping and menu mode and reports
+throughput, latency percentiles, tokens per request (from /metrics) and
+event-loop lag. Lag is measured from outside by probing /health while the
+load runs: a blocked event loop shows up as slow health checks. Without
+--url the fake OpenAI server and one backend per --formats entry are
+started locally, so json and compact output can be compared on the same
+load.
+
+    python bench/loadtest.py --requests 200 --concurrency 20
+    python bench/loadtest.py --formats json,compact --stream --max-p95 3.0
+    python bench/loadtest.py --url http://localhost:8000 --modes shopping
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(os.path.dirname(BENCH_DIR), "backend")
+STORES = [["Lidl", "Aldi"], ["Rewe"], ["Edeka", "Kaufland"], ["Lidl"]]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile; 0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+@contextmanager
+def spawned(args: List[str], ready_url: str, env: Optional[dict] = None, cwd: Optional[str] = None, quiet: bool = True):
+    output = subprocess.DEVNULL if quiet else None
+    process = subprocess.Popen(args, env=env, cwd=cwd, stdout=output, stderr=output)
+    try:
+        wait_ready(ready_url, process)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def payload(mode: str, i: int, days: int) -> dict:
+    body = {
+        "supermarkets": STORES[i % len(STORES)],
+        "budget": 40 + (i % 7) * 10,
+        "family_size": 1 + i % 4,
+        "mode": mode,
+        # Every request goes upstream; a warm cache would only measure the cache
+        "fresh": True,
+    }
+    if mode == "menu":
+        body["days"] = days
+    return body
+
+
+async def one_request(client: httpx.AsyncClient, mode: str, i: int, args) -> dict:
+    started = time.perf_counter()
+    first = None
+    try:
+        if args.stream:
+            async with client.stream("POST", "/generate/stream", json=payload(mode, i, args.days)) as response:
+                status = response.status_code
+                async for line in response.aiter_lines():
+                    if first is None and line.startswith("event: "):
+                        first = time.perf_counter() - started
+                    if line == "event: error":
+                        status = 599
+        else:
+            response = await client.post("/generate", json=payload(mode, i, args.days))
+            status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return {"status": status, "latency": time.perf_counter() - started, "first_event": first}
+
+
+async def token_counts(client: httpx.AsyncClient) -> dict:
+    """Prompt and completion token counters from the backend's /metrics, empty if unavailable."""
+    try:
+        text = (await client.get("/metrics")).text
+    except httpx.HTTPError:
+        return {}
+    counts = {}
+    for line in text.splitlines():
+        if line.startswith("shopsmart_llm_tokens_total{"):
+            labels, value = line.rsplit(" ", 1)
+            counts[labels.split('type="', 1)[1].split('"', 1)[0]] = float(value)
+    return counts
+
+
+async def probe(client: httpx.AsyncClient, interval: float, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/health")
+            samples.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def run_load(base_url: str, mode: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency + 2)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client, \
+            httpx.AsyncClient(base_url=base_url, timeout=timeout) as probe_client:
+        queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(i)
+        results = []
+
+        async def worker():
+            while not queue.empty():
+                results.append(await one_request(client, mode, queue.get_nowait(), args))
+
+        tokens_before = await token_counts(probe_client)
+        lag, stop = [], asyncio.Event()
+        probing = asyncio.create_task(probe(probe_client, args.probe_interval, lag, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probing
+        tokens_after = await token_counts(probe_client)
+
+    ok = [r["latency"] for r in results if r["status"] == 200]
+    first = [r["first_event"] for r in results if r["status"] == 200 and r["first_event"] is not None]
+    errors = {}
+    for r in results:
+        if r["status"] != 200:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+
+    def per_request(kind: str) -> Optional[float]:
+        if kind not in tokens_after or not results:
+            return None
+        return round((tokens_after[kind] - tokens_before.get(kind, 0)) / len(results), 1)
+
+    return {
+        "mode": mode,
+        "endpoint": "/generate/stream" if args.stream else "/generate",
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "p50": round(percentile(ok, 50), 4),
+        "p95": round(percentile(ok, 95), 4),
+        "p99": round(percentile(ok, 99), 4),
+        "first_event_p50": round(percentile(first, 50), 4) if first else None,
+        # Includes continuations and menu chunks; None when the backend has no /metrics
+        "prompt_tokens": per_request("prompt"),
+        "completion_tokens": per_request("completion"),
+        "loop_lag_p50": round(percentile(lag, 50), 4),
+        "loop_lag_p99": round(percentile(lag, 99), 4),
+        "loop_lag_max": round(max(lag, default=0.0), 4),
+    }
+
+
+def print_table(rows: List[dict]):
+    columns = ["format", "mode", "ok", "errors", "throughput", "p50", "p95", "p99", "first_event_p50", "completion_tokens", "loop_lag_p99", "loop_lag_max"]
+    cells = [[str(row.get(c) if c != "errors" else sum(row["errors"].values())) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def run_target(base_url: str, output_format: str, args) -> List[dict]:
+    rows = []
+    for mode in args.modes.split(","):
+        if args.warmup:
+            warm = argparse.Namespace(**{**vars(args), "requests": args.warmup, "concurrency": min(args.concurrency, args.warmup)})
+            asyncio.run(run_load(base_url, mode, warm))
+        row = asyncio.run(run_load(base_url, mode, args))
+        rows.append({"format": output_format, **row})
+        print(f"{output_format}/{mode}: {row['ok']}/{row['requests']} ok, p95 {row['p95']}s, {row['throughput']} req/s, "
+              f"{row['completion_tokens']} completion tokens/request", file=sys.stderr)
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ShopSmart AI load test")
+    parser.add_argument("--url", help="backend to test; without it a fake OpenAI server and backend are spawned")
+    parser.add_argument("--requests", type=int, default=100, help="requests per mode")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--modes", default="shopping,menu")
+    parser.add_argument("--days", type=int, default=7, help="menu length in menu mode")
+    parser.add_argument("--stream", action="store_true", help="use /generate/stream instead of /generate")
+    parser.add_argument("--formats", default="json", help="LLM_OUTPUT_FORMAT values to compare when spawning, e.g. json,compact")
+    parser.add_argument("--fake-args", default="", help='extra fake_openai.py arguments, e.g. "--ttft 0.5 --truncate-rate 0.05"')
+    parser.add_argument("--backend-env", action="append", default=[], metavar="KEY=VALUE", help="extra environment for spawned backends")
+    parser.add_argument("--warmup", type=int, default=5, help="requests per mode sent before measuring")
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--verbose", action="store_true", help="show the output of spawned servers")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--max-p95", type=float, help="exit with 1 if any p95 latency exceeds this many seconds")
+    parser.add_argument("--max-loop-lag", type=float, help="exit with 1 if any /health probe p99 exceeds this many seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="exit with 1 if more than this share of requests failed")
+    args = parser.parse_args()
+
+    if args.url:
+        rows = run_target(args.url.rstrip("/"), "?", args)
+    else:
+        rows = []
+        fake_port = free_port()
+        fake = [sys.executable, os.path.join(BENCH_DIR, "fake_openai.py"), "--port", str(fake_port), *shlex.split(args.fake_args)]
+        with spawned(fake, f"http://127.0.0.1:{fake_port}/docs", quiet=not args.verbose), tempfile.TemporaryDirectory() as tmp:
+            for output_format in args.formats.split(","):
+                port = free_port()
+                env = {
+                    **os.environ,
+                    "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+                    "OPENAI_API_KEY": "fake",
+                    "LLM_OUTPUT_FORMAT": output_format,
+                    "CACHE_DB_PATH": "",
+                    "BATCH_DB_PATH": os.path.join(tmp, f"batch-{output_format}.sqlite3"),
+                    **dict(item.split("=", 1) for item in args.backend_env),
+                }
+                backend = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"]
+                with spawned(backend, f"http://127.0.0.1:{port}/health", env=env, cwd=BACKEND_DIR, quiet=not args.verbose):
+                    rows += run_target(f"http://127.0.0.1:{port}", output_format, args)
+
+    print_table(rows)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(rows, f, indent=2)
+
+    failed = []
+    for row in rows:
+        name = f"{row['format']}/{row['mode']}"
+        if args.max_p95 is not None and row["p95"] > args.max_p95:
+            failed.append(f"{name}: p95 {row['p95']}s > {args.max_p95}s")
+        if args.max_loop_lag is not None and row["loop_lag_p99"] > args.max_loop_lag:
+            failed.append(f"{name}: /health p99 {row['loop_lag_p99']}s > {args.max_loop_lag}s")
+        if row["requests"] and (row["requests"] - row["ok"]) / row["requests"] > args.max_error_rate:
+            failed.append(f"{name}: {row['requests'] - row['ok']} of {row['requests']} requests failed {row['errors']}")
+    for message in failed:
+        print(f"FAIL {message}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
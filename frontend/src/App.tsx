@@ -3,7 +3,11 @@ import { ShopForm, ShoppingList, LoadingSpinner, ErrorBanner, LanguageSelector,
 import { LanguageProvider, useLanguage } from './LanguageContext';
 import { ThemeProvider } from './ThemeContext';
 import { apiService } from './api';
-import { AIResponse, UserInput } from './types';
+import { AIResponse, UserInput, RevisionInput } from './types';
+
+// Larger edits are regenerated: a delta on top of a very different list is slower and worse
+const MAX_REVISED_FIELDS = 2;
+const MAX_REVISED_BUDGET_CHANGE = 0.25;
 
 const AppContent: React.FC = () => {
   const [response, setResponse] = useState<AIResponse | null>(null);
@@ -11,17 +15,54 @@ const AppContent: React.FC = () => {
   const [error, setError] = useState<string | null>(null);
   const [historyOpen, setHistoryOpen] = useState(false);
   const [isMenuMode, setIsMenuMode] = useState(false);
+  const [lastGeneration, setLastGeneration] = useState<{ input: UserInput; id: string; result: AIResponse } | null>(null);
   const { t } = useLanguage();
 
+  const getChanges = (previous: UserInput, input: UserInput): RevisionInput => {
+    const changes: RevisionInput = {};
+    if (previous.budget !== input.budget) changes.budget = input.budget;
+    if (previous.preferences !== input.preferences) changes.preferences = input.preferences;
+    if (previous.family_size !== input.family_size) changes.family_size = input.family_size;
+    if (previous.days !== input.days) changes.days = input.days;
+    if ([...previous.supermarkets].sort().join() !== [...input.supermarkets].sort().join()) changes.supermarkets = input.supermarkets;
+    return changes;
+  };
+
+  const reviseLast = async (input: UserInput): Promise<AIResponse | null> => {
+    // Small edits of the previous request only ask the server for the difference
+    if (!lastGeneration || lastGeneration.input.mode !== input.mode || lastGeneration.input.language !== input.language
+        || (lastGeneration.input.engine ?? 'llm') !== (input.engine ?? 'llm')) {
+      return null;
+    }
+    const changes = getChanges(lastGeneration.input, input);
+    const changed = Object.keys(changes).length;
+    if (changed === 0) return lastGeneration.result;
+    if (changed > MAX_REVISED_FIELDS) return null;
+    const previousBudget = lastGeneration.input.budget;
+    if (changes.budget !== undefined && Math.abs(changes.budget - previousBudget) > previousBudget * MAX_REVISED_BUDGET_CHANGE) {
+      return null;
+    }
+    return apiService.reviseShoppingList(lastGeneration.id, changes);
+  };
+
   const handleGenerate = async (input: UserInput) => {
     setLoading(true);
     setError(null);
     setIsMenuMode(input.mode === 'menu');
     try {
-      const result = await apiService.generateShoppingList(input);
+      const result = (await reviseLast(input)) || await apiService.streamShoppingList(input, (partial) => {
+        // Show the list as soon as the first entries arrive
+        if (partial.items.length > 0 || partial.menu?.length) {
+          setResponse(partial);
+          setLoading(false);
+        }
+      });
       setResponse(result);
+      if (result === lastGeneration?.result) return;
+      setLastGeneration(result.generation_id ? { input, id: result.generation_id, result } : null);
       saveListToHistory(result, input.budget);
     } catch (err) {
+      setResponse(null);
       setError(err instanceof Error ? err.message : 'An error occurred');
     } finally {
       setLoading(false);
@@ -1,4 +1,4 @@
-import { UserInput, AIResponse } from './types';
+import { UserInput, AIResponse, RevisionInput } from './types';
 
 const API_BASE_URL = import.meta.env.PROD 
   ? 'https://shopsmart-ai-production.up.railway.app'
@@ -43,6 +43,108 @@ class ApiService {
     }
   }
 
+  async streamShoppingList(input: UserInput, onPartial: (partial: AIResponse) => void): Promise<AIResponse> {
+    const controller = new AbortController();
+    let timeoutId = setTimeout(() => controller.abort(), this.timeout);
+
+    try {
+      const response = await fetch(`${this.baseUrl}/generate/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(input),
+        signal: controller.signal,
+      });
+
+      if (!response.ok || !response.body) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || `HTTP error! status: ${response.status}`);
+      }
+
+      const result: AIResponse = { items: [], total_cost: 0, notes: '', generated_at: '' };
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        // The timeout only guards against a stalled stream, not a slow one
+        clearTimeout(timeoutId);
+        timeoutId = setTimeout(() => controller.abort(), this.timeout);
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = raw.match(/^data: (.*)$/m)?.[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+
+          if (event === 'item') {
+            result.items = [...result.items, payload];
+          } else if (event === 'day') {
+            result.menu = [...(result.menu || []), payload];
+          } else if (event === 'summary') {
+            Object.assign(result, payload);
+          } else if (event === 'error') {
+            throw new Error(payload.detail);
+          }
+          onPartial({ ...result });
+        }
+      }
+
+      clearTimeout(timeoutId);
+      if (!result.generated_at) {
+        throw new Error('Incomplete response. Please try again.');
+      }
+      return result;
+    } catch (error) {
+      clearTimeout(timeoutId);
+      if (error instanceof Error && error.name === 'AbortError') {
+        throw new Error('Request timed out. Please try again.');
+      }
+      throw error;
+    }
+  }
+
+  async reviseShoppingList(generationId: string, changes: RevisionInput): Promise<AIResponse | null> {
+    const controller = new AbortController();
+    const timeoutId = setTimeout(() => controller.abort(), this.timeout);
+
+    try {
+      const response = await fetch(`${this.baseUrl}/generate/${generationId}/revise`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(changes),
+        signal: controller.signal,
+      });
+
+      clearTimeout(timeoutId);
+
+      // The server no longer has the previous list, the caller should generate a new one
+      if (response.status === 404) return null;
+
+      if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || `HTTP error! status: ${response.status}`);
+      }
+
+      return await response.json();
+    } catch (error) {
+      clearTimeout(timeoutId);
+      if (error instanceof Error && error.name === 'AbortError') {
+        throw new Error('Request timed out. Please try again.');
+      }
+      throw error;
+    }
+  }
+
   async healthCheck(): Promise<boolean> {
     try {
       const response = await fetch(`${this.baseUrl}/health`);
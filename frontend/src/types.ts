@@ -6,6 +6,7 @@ export interface UserInput {
   language: string;
   mode: 'shopping' | 'menu';
   days?: number;
+  engine?: 'llm' | 'catalog';
 }
 
 export interface ShoppingItem {
@@ -46,8 +47,11 @@ export interface AIResponse {
     carbs: number;
   };
   menu?: DayMenu[];
+  generation_id?: string;
 }
 
+export type RevisionInput = Partial<Pick<UserInput, 'supermarkets' | 'budget' | 'preferences' | 'family_size' | 'language' | 'days'>>;
+
 export type ProductCategory = 
   | 'vegetables' | 'fruits' | 'meat' | 'fish' | 'dairy' 
   | 'bread' | 'beverages' | 'snacks' | 'frozen' | 'pantry' 